@@ -49,4 +49,19 @@ def create_app():
     app.register_blueprint(notifications_bp, url_prefix="/api/notifications")
     app.register_blueprint(public_bp,url_prefix="/api/public")
 
+    # CLI commands (flask cash-balances reconcile, ...)
+    from .cash_balances import cash_balances_cli
+    from .push_subscriptions import push_subscriptions_cli
+    from .auth.passwords import passwords_cli
+    from .invoice_generation import invoices_cli
+    from .month_stats import month_stats_cli
+    from .unit_registry import units_cli
+
+    app.cli.add_command(cash_balances_cli)
+    app.cli.add_command(push_subscriptions_cli)
+    app.cli.add_command(passwords_cli)
+    app.cli.add_command(invoices_cli)
+    app.cli.add_command(month_stats_cli)
+    app.cli.add_command(units_cli)
+
     return app
\ No newline at end of file
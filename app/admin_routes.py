@@ -1,7 +1,9 @@
 from datetime import date,datetime
 from flask import Blueprint, jsonify, request, send_file, render_template, current_app
-from io import BytesIO
+from io import BytesIO, StringIO, TextIOWrapper
+import csv
 from sqlalchemy import or_, func, and_
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import aliased
 from decimal import Decimal
 
@@ -24,12 +26,27 @@ from app.models import (
     UnionLedgerEntry
 )
 from .auth.routes import get_current_user_from_request
+from .auth.principal import get_allowed_buildings
+from .cash_balances import (
+    get_admin_cash_balance,
+    record_collection,
+    record_invoice_collected,
+    record_invoice_payments_removed,
+)
+from .union_ledger import append_ledger_entry
+from .unit_lookup import resolve_unit
+from .bulk_collect import bulk_collect, BULK_COLLECT_CHUNK_SIZE
+from .bulk_import_invoices import check_import_columns, write_results
+from .invoice_generation import (
+    generate_invoices, parse_amount, parse_period, parse_schedule, DEFAULT_AMOUNT, DEFAULT_DUE_DAY,
+)
+from .resident_onboarding import onboard_residents, MAX_BULK_USERS
 
 admin_bp = Blueprint("admin", __name__)
 
 def get_admin_allowed_buildings(admin_id: int):
-    rows = AdminBuilding.query.filter_by(admin_id=admin_id).all()
-    return [r.building for r in rows]
+    # cached per request / per process (see app.auth.principal)
+    return get_allowed_buildings(admin_id)
 
 def create_initial_invoices_for_resident(user: User):
     """
@@ -39,49 +56,74 @@ def create_initial_invoices_for_resident(user: User):
     """
     today = datetime.now()
 
-    # Start from current month & year
-    year = today.year
-    month = today.month
-
-    # End at December next year
-    end_year = year + 1
-    end_month = 12
-
-    while year < end_year or (year == end_year and month <= end_month):
-        # 👇 keep your existing amount / due_date / notes logic here
-        # Example (you probably already have something like this):
-        #
-        # amount = Decimal("200.00")   # or from config / DB
-        # due_day = 5
-        # due_date = date(year, month, due_day)
-
-        invoice = MaintenanceInvoice(
-            user_id=user.id,
-            year=year,
-            month=month,
-            amount=Decimal("200.00"),  # TODO: replace with your actual logic
-            status="UNPAID",
-            due_date=date(year, month, 5),  # TODO: replace with your actual due date logic
-            notes=None,
-        )
-        db.session.add(invoice)
-
-        # Move to next month
-        month += 1
-        if month > 12:
-            month = 1
-            year += 1
+    # one INSERT ... SELECT (see app.invoice_generation); user must be flushed
+    generate_invoices(
+        (today.year, today.month),
+        (today.year + 1, 12),
+        user_ids=[user.id],
+    )
 
 def get_paid_invoices_for_month(year: int, month: int):
     """
     ترجع قائمة بالفواتير المدفوعة لشهر/سنة معينة،
     مع بيانات المقيم ونوع الدفع وتاريخ السداد.
     """
+    # آخر OnlinePayment APPROVED وآخر Payment لكل فاتورة (ROW_NUMBER بدل query لكل فاتورة)
+    latest_online = (
+        db.session.query(
+            OnlinePayment.invoice_id.label("invoice_id"),
+            OnlinePayment.confirmed_at.label("confirmed_at"),
+            func.row_number()
+            .over(
+                partition_by=OnlinePayment.invoice_id,
+                order_by=(OnlinePayment.confirmed_at.desc(), OnlinePayment.id.desc()),
+            )
+            .label("rn"),
+        )
+        .filter(OnlinePayment.status == "APPROVED")
+        .subquery()
+    )
+
+    latest_payment = (
+        db.session.query(
+            Payment.invoice_id.label("invoice_id"),
+            Payment.created_at.label("created_at"),
+            func.row_number()
+            .over(
+                partition_by=Payment.invoice_id,
+                order_by=(Payment.created_at.desc(), Payment.id.desc()),
+            )
+            .label("rn"),
+        )
+        .subquery()
+    )
+
     # نجيب كل الفواتير PAID للمقيمين
     query = (
-        db.session.query(MaintenanceInvoice, PersonDetails, User)
+        db.session.query(
+            MaintenanceInvoice,
+            PersonDetails,
+            latest_online.c.invoice_id.label("online_invoice_id"),
+            latest_online.c.confirmed_at.label("online_confirmed_at"),
+            latest_payment.c.invoice_id.label("payment_invoice_id"),
+            latest_payment.c.created_at.label("payment_created_at"),
+        )
         .join(User, MaintenanceInvoice.user_id == User.id)
         .join(PersonDetails, PersonDetails.user_id == User.id)
+        .outerjoin(
+            latest_online,
+            and_(
+                latest_online.c.invoice_id == MaintenanceInvoice.id,
+                latest_online.c.rn == 1,
+            ),
+        )
+        .outerjoin(
+            latest_payment,
+            and_(
+                latest_payment.c.invoice_id == MaintenanceInvoice.id,
+                latest_payment.c.rn == 1,
+            ),
+        )
         .filter(
             MaintenanceInvoice.status == "PAID",
             MaintenanceInvoice.year == year,
@@ -99,32 +141,22 @@ def get_paid_invoices_for_month(year: int, month: int):
     rows = []
     serial = 1
 
-    for invoice, person, user in query.all():
+    for row in query.all():
+        invoice = row.MaintenanceInvoice
+        person = row.PersonDetails
+
         # نحدد نوع الدفع و تاريخ السداد
         payment_type = "UNKNOWN"
         payment_date = invoice.paid_date
 
         # أولوية: لو فيه OnlinePayment APPROVED → نعتبرها Online
-        online = (
-            OnlinePayment.query
-            .filter_by(invoice_id=invoice.id, status="APPROVED")
-            .order_by(OnlinePayment.confirmed_at.desc())
-            .first()
-        )
-        if online:
+        if row.online_invoice_id is not None:
             payment_type = "ONLINE"
-            payment_date = online.confirmed_at or payment_date
-        else:
+            payment_date = row.online_confirmed_at or payment_date
+        elif row.payment_invoice_id is not None:
             # لو مفيش أونلاين، نشوف الـ Payment (الكاش)
-            pay = (
-                Payment.query
-                .filter_by(invoice_id=invoice.id)
-                .order_by(Payment.created_at.desc())
-                .first()
-            )
-            if pay:
-                payment_type = "CASH"
-                payment_date = pay.created_at or payment_date
+            payment_type = "CASH"
+            payment_date = row.payment_created_at or payment_date
 
         if payment_date is not None:
             payment_date_str = payment_date.date().isoformat()  # YYYY-MM-DD
@@ -224,17 +256,33 @@ def admin_search_residents():
     apartment = request.args.get("apartment", type=str)
 
     current_user, error = get_current_user_from_request(
-        allowed_roles=["ADMIN", "SUPERADMIN","ONLINE_ADMIN"]
+        allowed_roles=["ADMIN", "SUPERADMIN","ONLINE_ADMIN"], read_only=True
     )
     if error:
         message, status = error
         return jsonify({"message": message}), status
 
 
+    # Unpaid invoices per resident, aggregated once and joined to the search
+    unpaid_counts = (
+        db.session.query(
+            MaintenanceInvoice.user_id.label("user_id"),
+            func.count(MaintenanceInvoice.id).label("unpaid_count"),
+        )
+        .filter(MaintenanceInvoice.status != "PAID")
+        .group_by(MaintenanceInvoice.user_id)
+        .subquery()
+    )
+
     # Base query
     q = (
-        db.session.query(User, PersonDetails)
+        db.session.query(
+            User,
+            PersonDetails,
+            func.coalesce(unpaid_counts.c.unpaid_count, 0).label("unpaid_count"),
+        )
         .join(PersonDetails, PersonDetails.user_id == User.id)
+        .outerjoin(unpaid_counts, unpaid_counts.c.user_id == User.id)
         .filter(User.role == "RESIDENT")
     )
     
@@ -253,14 +301,7 @@ def admin_search_residents():
     residents = q.order_by(PersonDetails.building, PersonDetails.floor, PersonDetails.apartment).all()
 
     results = []
-    for user, details in residents:
-        unpaid_count = (
-            MaintenanceInvoice.query
-            .filter_by(user_id=user.id)
-            .filter(MaintenanceInvoice.status != "PAID")
-            .count()
-        )
-
+    for user, details, unpaid_count in residents:
         results.append({
             "id": user.id,
             "username": user.username,
@@ -271,7 +312,7 @@ def admin_search_residents():
                 "floor": details.floor,
                 "apartment": details.apartment,
             },
-            "unpaid_invoices_count": unpaid_count,
+            "unpaid_invoices_count": int(unpaid_count or 0),
         })
 
     return jsonify(results)
@@ -282,7 +323,7 @@ def admin_resident_invoices(user_id: int):
     Get all invoices for a specific resident (for Admin view).
     """
     current_user, error = get_current_user_from_request(
-        allowed_roles=["ADMIN", "SUPERADMIN","ONLINE_ADMIN"]
+        allowed_roles=["ADMIN", "SUPERADMIN","ONLINE_ADMIN"], read_only=True
     )
     if error:
         message, status = error
@@ -300,24 +341,57 @@ def admin_resident_invoices(user_id: int):
     if not resident:
         return jsonify({"message": "resident not found"}), 404
 
+    # آخر Payment لكل فاتورة + دور اللي حصّلها، في query واحدة
+    latest_payment = (
+        db.session.query(
+            Payment.invoice_id.label("invoice_id"),
+            Payment.created_at.label("created_at"),
+            Payment.collected_by_admin_id.label("collected_by_admin_id"),
+            func.row_number()
+            .over(
+                partition_by=Payment.invoice_id,
+                order_by=(Payment.created_at.desc(), Payment.id.desc()),
+            )
+            .label("rn"),
+        )
+        # by invoice only: a payment may be recorded under another user_id
+        .filter(
+            Payment.invoice_id.in_(
+                db.session.query(MaintenanceInvoice.id).filter(MaintenanceInvoice.user_id == resident.id)
+            )
+        )
+        .subquery()
+    )
+    Collector = aliased(User)
+
     invoices = (
-        MaintenanceInvoice.query
-        .filter_by(user_id=resident.id)
+        db.session.query(
+            MaintenanceInvoice,
+            latest_payment.c.invoice_id.label("payment_invoice_id"),
+            latest_payment.c.created_at.label("payment_created_at"),
+            Collector.role.label("collected_by_role"),
+        )
+        .outerjoin(
+            latest_payment,
+            and_(
+                latest_payment.c.invoice_id == MaintenanceInvoice.id,
+                latest_payment.c.rn == 1,
+            ),
+        )
+        .outerjoin(Collector, Collector.id == latest_payment.c.collected_by_admin_id)
+        .filter(MaintenanceInvoice.user_id == resident.id)
         .order_by(MaintenanceInvoice.year.desc(), MaintenanceInvoice.month.desc())
         .all()
     )
 
-
     result = []
-    for inv in invoices:
-        payment = Payment.query.filter_by(invoice_id=inv.id).order_by(Payment.created_at.desc()).first()
-
-        if payment:
-            if payment.collected_by.role == "ONLINE_ADMIN":
+    for inv, payment_invoice_id, payment_created_at, collected_by_role in invoices:
+        if payment_invoice_id is not None:
+            if collected_by_role == "ONLINE_ADMIN":
                 payment_type = "ONLINE"
             else:
                 payment_type = "CASH"
-            payment_date = payment.created_at.isoformat()
+            payment_date = payment_created_at.isoformat()
         else:
             payment_type = None
             payment_date = None
@@ -411,6 +485,8 @@ def admin_collect_payment():
     )
 
     db.session.add(payment)
+    record_collection(current_user.id, amount_val)
+    record_invoice_collected({invoice.id: amount_val})
     db.session.commit()
 
     return jsonify({
@@ -434,6 +510,73 @@ def admin_collect_payment():
         }
     })
 
+@admin_bp.route("/bulk/collect", methods=["POST"])
+def admin_bulk_collect():
+    """
+    Bulk version of the CSV importer (bulk_import_invoices.py), done server-side:
+    for each row find the resident's invoice for year/month (create it if
+    missing), then collect payment_amount on it.
+
+    Input:
+      - multipart upload `file` = the importer's CSV, or
+      - JSON { "rows": [ {building, floor, apartment, year, month,
+                          invoice_amount, payment_amount, ...}, ... ] }
+    Query params:
+      - format=csv → results as CSV (same columns as import_results.csv)
+      - chunk_size → rows per transaction (default 500)
+      - dry_run=1 → validate / plan every row (same results), write nothing
+
+    Same building restriction as /collect: ADMIN only within their buildings.
+    """
+    current_user, error = get_current_user_from_request(allowed_roles=["ADMIN","ONLINE_ADMIN"])
+    if error:
+        message, status = error
+        return jsonify({"message": message}), status
+
+    upload = request.files.get("file")
+    if upload:
+        # streamed: rows are read chunk by chunk while processing
+        reader = csv.DictReader(TextIOWrapper(upload.stream, encoding="utf-8-sig", newline=""))
+        try:
+            check_import_columns(reader.fieldnames)
+        except ValueError as e:
+            return jsonify({"message": str(e)}), 400
+        rows = enumerate(reader, start=2)
+    else:
+        data = request.get_json(silent=True)
+        raw_rows = data.get("rows") if isinstance(data, dict) else data
+        if not isinstance(raw_rows, list) or not all(isinstance(r, dict) for r in raw_rows):
+            return jsonify({"message": "send a CSV `file` or JSON { rows: [...] }"}), 400
+        rows = list(enumerate(raw_rows, start=1))
+
+    chunk_size = request.args.get("chunk_size", BULK_COLLECT_CHUNK_SIZE, type=int)
+    if chunk_size < 1:
+        return jsonify({"message": "invalid chunk_size"}), 400
+
+    allowed = None
+    if current_user.role == "ADMIN":
+        allowed = get_admin_allowed_buildings(current_user.id)
+
+    dry_run = request.args.get("dry_run", "").lower() in ("1", "true", "yes")
+
+    results, summary = bulk_collect(
+        rows, current_user, allowed_buildings=allowed, chunk_size=chunk_size, dry_run=dry_run
+    )
+    if not results:
+        return jsonify({"message": "no rows"}), 400
+
+    if request.args.get("format") == "csv":
+        out = StringIO()
+        write_results(results, out)
+        return send_file(
+            BytesIO(out.getvalue().encode("utf-8")),
+            mimetype="text/csv",
+            as_attachment=True,
+            download_name="import_plan.csv" if dry_run else "import_results.csv",
+        )
+
+    return jsonify({"results": results, "summary": summary})
+
 @admin_bp.route("/invoices", methods=["POST"])
 def admin_create_invoice():
     """
@@ -482,17 +625,6 @@ def admin_create_invoice():
     if not resident:
         return jsonify({"message": "resident not found"}), 404
 
-    # تأكد إنه مفيش فاتورة لنفس الشهر و السنة
-    existing = (
-        MaintenanceInvoice.query
-        .filter_by(user_id=user_id, year=year, month=month)
-        .first()
-    )
-    if existing:
-        return jsonify({
-            "message": "يوجد بالفعل فاتورة لهذا الشهر والسنة. يمكنك حذف الفاتورة القديمة أولاً ثم إنشاء واحدة جديدة."
-        }), 400
-
     # Parse due_date لو موجود
     due_date = None
     if due_date_str:
@@ -511,8 +643,23 @@ def admin_create_invoice():
         notes=notes,
     )
 
+    # تأكد إنه مفيش فاتورة لنفس الشهر و السنة:
+    # the unique (user_id, year, month) index decides, no SELECT beforehand
     db.session.add(invoice)
-    db.session.commit()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        existing = (
+            MaintenanceInvoice.query
+            .filter_by(user_id=user_id, year=year, month=month)
+            .first()
+        )
+        if not existing:
+            raise
+        return jsonify({
+            "message": "يوجد بالفعل فاتورة لهذا الشهر والسنة. يمكنك حذف الفاتورة القديمة أولاً ثم إنشاء واحدة جديدة."
+        }), 400
 
     return jsonify({
         "message": "invoice created",
@@ -598,25 +745,15 @@ def admin_me_summary():
     - outstanding amount
     - recent payments
     """
-    current_user, error = get_current_user_from_request(allowed_roles=["ADMIN","ONLINE_ADMIN"])
+    current_user, error = get_current_user_from_request(allowed_roles=["ADMIN","ONLINE_ADMIN"], read_only=True)
     if error:
         message, status = error
         return jsonify({"message": message}), status
 
-    # Total collected
-    total_amount = (
-        db.session.query(func.coalesce(func.sum(Payment.amount), 0))
-        .filter(Payment.collected_by_admin_id == current_user.id)
-        .scalar()
-        or 0
-    )
-
-    payments_count = (
-        db.session.query(func.count(Payment.id))
-        .filter(Payment.collected_by_admin_id == current_user.id)
-        .scalar()
-        or 0
-    )
+    # Total collected / settled / outstanding from the maintained running balance
+    balance = get_admin_cash_balance(current_user.id)
+    total_amount = balance["total_amount"]
+    payments_count = balance["payments_count"]
 
     # Today
     today = datetime.now()
@@ -641,15 +778,10 @@ def admin_me_summary():
     )
 
     # Total settled (what admin already handed over to treasurer)
-    settled_amount = (
-        db.session.query(func.coalesce(func.sum(Settlement.amount), 0))
-        .filter(Settlement.admin_id == current_user.id)
-        .scalar()
-        or 0
-    )
+    settled_amount = balance["settled_amount"]
 
     # Outstanding = collected - settled
-    outstanding_amount = float(total_amount) - float(settled_amount)
+    outstanding_amount = balance["outstanding_amount"]
 
     # Recent payments
     recent = (
@@ -761,18 +893,8 @@ def superadmin_create_user():
                 400,
             )
 
-        # Check if another RESIDENT already has this exact unit
-        existing_unit = (
-            db.session.query(PersonDetails)
-            .join(User, PersonDetails.user_id == User.id)
-            .filter(
-                User.role == "RESIDENT",
-                PersonDetails.building == building,
-                PersonDetails.floor == floor,
-                PersonDetails.apartment == apartment,
-            )
-            .first()
-        )
+        # Check if another RESIDENT already has this exact unit (always from the DB)
+        existing_unit = resolve_unit(building, floor, apartment, use_cache=False)
 
         if existing_unit:
             return (
@@ -824,6 +946,51 @@ def superadmin_create_user():
     ), 201
 
 
+@admin_bp.route("/users/bulk", methods=["POST"])
+def superadmin_create_residents_bulk():
+    """
+    SuperAdmin onboards many residents at once (e.g. a new building).
+    Body: { "residents": [ { username, password, full_name, building, floor,
+                            apartment, phone }, ... ] }
+    Same rules as POST /users for a RESIDENT; all are created or none
+    (400 with per-row errors).
+    """
+    current_user, error = get_current_user_from_request(allowed_roles=["SUPERADMIN"])
+    if error:
+        message, status = error
+        return jsonify({"message": message}), status
+
+    data = request.get_json() or {}
+    entries = data.get("residents")
+
+    if not isinstance(entries, list) or not entries:
+        return jsonify({"message": "residents list is required"}), 400
+    if len(entries) > MAX_BULK_USERS:
+        return jsonify({"message": f"at most {MAX_BULK_USERS} residents per request"}), 400
+
+    try:
+        users, invoices_created, errors = onboard_residents(entries)
+    except IntegrityError:
+        # a username was taken by a concurrent request after validation
+        db.session.rollback()
+        return jsonify({"message": "username already exists, no users created"}), 400
+
+    if errors:
+        db.session.rollback()
+        return jsonify({"message": "no users created", "errors": errors}), 400
+
+    db.session.commit()
+
+    return jsonify(
+        {
+            "message": "users created",
+            "created": len(users),
+            "invoices_created": invoices_created,
+            "users": users,
+        }
+    ), 201
+
+
 @admin_bp.route("/superadmin/residents/<int:user_id>/profile", methods=["POST"])
 def superadmin_update_resident_profile(user_id):
     """
@@ -897,6 +1064,48 @@ def superadmin_update_resident_profile(user_id):
         },
     })
 
+@admin_bp.route("/superadmin/invoices/generate", methods=["POST"])
+def superadmin_generate_invoices():
+    """
+    SUPERADMIN: create missing invoices for all residents over a period range
+    (same as `flask invoices generate`).
+    Body:
+      - from, to (required): "YYYY-MM"
+      - amount (optional, default 200), due_day (optional, default 5)
+      - schedule (optional): { "YYYY-MM": amount } — amount from that month on
+      - buildings (optional): only residents of these buildings
+      - dry_run (optional bool): only count
+    """
+    current_user, error = get_current_user_from_request(allowed_roles=["SUPERADMIN"])
+    if error:
+        msg, status = error
+        return jsonify({"message": msg}), status
+
+    data = request.get_json() or {}
+    buildings = data.get("buildings") or None
+    dry_run = bool(data.get("dry_run", False))
+
+    try:
+        report = generate_invoices(
+            parse_period(data.get("from")),
+            parse_period(data.get("to")),
+            amount=parse_amount(data.get("amount", DEFAULT_AMOUNT)),
+            due_day=int(data.get("due_day", DEFAULT_DUE_DAY)),
+            schedule=parse_schedule(data.get("schedule") or {}),
+            buildings=[str(b) for b in buildings] if buildings else None,
+            dry_run=dry_run,
+        )
+    except (ValueError, TypeError, ArithmeticError) as e:
+        db.session.rollback()
+        return jsonify({"message": str(e)}), 400
+
+    if dry_run:
+        db.session.rollback()
+    else:
+        db.session.commit()
+
+    return jsonify({"dry_run": dry_run, **report})
+
 @admin_bp.route("/superadmin/invoices/<int:invoice_id>", methods=["PUT", "PATCH"])
 def superadmin_update_invoice_status(invoice_id: int):
     """
@@ -931,6 +1140,7 @@ def superadmin_update_invoice_status(invoice_id: int):
 
     # 1) لو من PAID → UNPAID → امسح الـ payments
     if old_status == "PAID" and new_status == "UNPAID":
+        record_invoice_payments_removed(invoice.id)
         Payment.query.filter_by(invoice_id=invoice.id).delete(
             synchronize_session=False
         )
@@ -956,6 +1166,8 @@ def superadmin_update_invoice_status(invoice_id: int):
                 notes="Created automatically by SUPERADMIN status update",
             )
             db.session.add(p)
+            record_collection(user.id, invoice.amount)
+            record_invoice_collected({invoice.id: invoice.amount})
 
         # في كل الأحوال لو بقت PAID خَلّي paid_date = now (لو مش متسجل قبل كده)
         if not invoice.paid_date:
@@ -1067,6 +1279,8 @@ def admin_approve_online_payment(payment_id: int):
         op.notes = extra_notes
 
     db.session.add(payment)
+    record_collection(current_user.id, op.amount)
+    record_invoice_collected({invoice.id: op.amount})
     db.session.commit()
 
     return jsonify({"message": "online payment approved"}), 200
@@ -1319,10 +1533,6 @@ def superadmin_get_resident_profile(user_id):
         },
     })
 
-def _get_union_balance():
-    last = UnionLedgerEntry.query.order_by(UnionLedgerEntry.id.desc()).first()
-    return float(last.balance_after) if last else 0.0
-
 @admin_bp.route("/superadmin/fundraisers", methods=["POST"])
 def superadmin_create_fundraiser():
 
@@ -1371,19 +1581,13 @@ def superadmin_create_fundraiser():
     db.session.add(fr)
 
     # Reflect in Union ledger as CREDIT
-    old_balance = _get_union_balance()
-    new_balance = old_balance + amount
-
-    entry = UnionLedgerEntry(
+    entry = append_ledger_entry(
         date=datetime.utcnow(),
         description=f"لوحة الشرف: {name} ({month}/{year})",
-        debit=Decimal("0"),
-        credit=Decimal(str(round(amount, 2))),
-        balance_after=Decimal(str(round(new_balance, 2))),
         entry_type="FUNDRAISING",
-        created_by_id =user.id
+        created_by_id=user.id,
+        credit=amount,
     )
-    db.session.add(entry)
 
     db.session.commit()
 
@@ -1466,20 +1670,16 @@ def superadmin_update_fundraiser(fundraiser_id: int):
     union_balance_after = None
     if amount_changed:
         delta = float(new_amount) - old_amount  # + means increase, - means decrease
-        prev_balance = _get_union_balance()
-        new_balance = prev_balance + delta
 
-        entry = UnionLedgerEntry(
+        entry = append_ledger_entry(
             date=datetime.utcnow(),
             description=f"تعديل لوحة الشرف - {new_name} ({fr.month}/{fr.year})",
-            debit=float(-delta) if delta < 0 else 0.0,
-            credit=float(delta) if delta > 0 else 0.0,
-            balance_after=new_balance,
             entry_type="FUNDRAISER_ADJUST",
             created_by_id=current_user.id,
+            debit=-delta if delta < 0 else 0.0,
+            credit=delta if delta > 0 else 0.0,
         )
-        db.session.add(entry)
-        union_balance_after = new_balance
+        union_balance_after = float(entry.balance_after)
 
     db.session.commit()
 
@@ -0,0 +1,103 @@
+"""
+Password hashing settings, rehash-on-login and (optional) bounded verification pool.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+from flask.cli import AppGroup
+from werkzeug.security import generate_password_hash, check_password_hash
+
+from app.config import Config
+
+passwords_cli = AppGroup("passwords", help="Password hashing tools.")
+
+_method_prefix = None
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def hash_password(password: str) -> str:
+    if Config.PASSWORD_HASH_METHOD:
+        return generate_password_hash(password, method=Config.PASSWORD_HASH_METHOD)
+    return generate_password_hash(password)
+
+
+def hash_passwords(passwords, max_workers: int = None):
+    """
+    hash_password for many passwords at once (bulk onboarding). hashlib
+    releases the GIL, so a small thread pool uses several cores.
+    """
+    passwords = list(passwords)
+    workers = max(1, min(max_workers or os.cpu_count() or 1, len(passwords)))
+    if workers == 1:
+        return [hash_password(p) for p in passwords]
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash") as pool:
+        return list(pool.map(hash_password, passwords))
+
+
+def _configured_prefix() -> str:
+    """
+    The full "method:params" prefix werkzeug writes for PASSWORD_HASH_METHOD
+    (e.g. "scrypt" → "scrypt:32768:8:1"), computed once.
+    """
+    global _method_prefix
+    if _method_prefix is None:
+        _method_prefix = hash_password("").split("$", 1)[0]
+    return _method_prefix
+
+
+def needs_rehash(password_hash: str) -> bool:
+    """
+    True when PASSWORD_HASH_METHOD is set and the stored hash was made with
+    other parameters. Unset → existing hashes are left as they are.
+    """
+    if not Config.PASSWORD_HASH_METHOD:
+        return False
+    return (password_hash or "").split("$", 1)[0] != _configured_prefix()
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(
+                    max_workers=Config.PASSWORD_VERIFY_WORKERS,
+                    thread_name_prefix="password-verify",
+                )
+    return _pool
+
+
+def verify_password(password_hash: str, password: str) -> bool:
+    """
+    check_password_hash, run in the bounded pool when PASSWORD_VERIFY_WORKERS > 0
+    so at most that many hashes are computed at once per worker process.
+    """
+    if not password_hash or password is None:
+        return False
+    if Config.PASSWORD_VERIFY_WORKERS <= 0:
+        return check_password_hash(password_hash, password)
+    return _get_pool().submit(check_password_hash, password_hash, password).result()
+
+
+@passwords_cli.command("benchmark")
+@click.option("--seconds", default=3.0, show_default=True, help="How long to run.")
+@click.option("--method", default=None, help="Hash method to test (default: configured).")
+def benchmark_command(seconds: float, method: str):
+    """Report password verifications per second for one worker (hashing only, not the login endpoint)."""
+    method = method or Config.PASSWORD_HASH_METHOD or None
+    password_hash = generate_password_hash("benchmark", method=method) if method else hash_password("benchmark")
+
+    count = 0
+    started = time.perf_counter()
+    while time.perf_counter() - started < seconds:
+        verify_password(password_hash, "benchmark")
+        count += 1
+    elapsed = time.perf_counter() - started
+
+    click.echo(f"method: {password_hash.split('$', 1)[0]}")
+    click.echo(f"{count} verifications in {elapsed:.2f}s → {count / elapsed:.1f} verifications/sec per worker "
+               f"({elapsed / count * 1000:.1f} ms each)")
@@ -0,0 +1,249 @@
+"""
+Authenticated-user ("principal") caching.
+
+- Per request: the principal is stored on flask.g, so repeated
+  get_current_user_from_request / get_admin_allowed_buildings calls are free.
+- Per process: a short-TTL cache keyed by user id (the token `sub`), so hot
+  read-only endpoints don't hit `users` / `admin_buildings` on every call
+  (endpoints that may write always read the user row). Entries are
+  dropped after commit whenever a User or AdminBuilding row changes; other
+  gunicorn workers pick the change up when their TTL expires.
+- Token claims: read-only endpoints can build the principal straight from the
+  JWT (role + buildings) as long as its `ver` matches users.token_version,
+  which is bumped on every role / password / building change.
+"""
+import threading
+import time
+
+from flask import g, has_app_context
+from sqlalchemy import event, inspect, update
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+from app import db
+from app.models import User, AdminBuilding
+from app.config import Config
+
+USER_COLUMNS = [c.key for c in User.__table__.columns]
+
+
+class _TTLCache:
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        if self.ttl <= 0:
+            return None
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key, value):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_users_cache = _TTLCache(Config.PRINCIPAL_CACHE_TTL)
+_buildings_cache = _TTLCache(Config.PRINCIPAL_CACHE_TTL)
+_versions_cache = _TTLCache(Config.PRINCIPAL_CACHE_TTL)
+
+# changing any of these makes previously issued token claims stale
+TOKEN_VERSION_FIELDS = ("role", "password_hash")
+
+
+class Principal:
+    """
+    The authenticated user for this request: id, role and (for admins)
+    allowed buildings. `.user` is the session-bound User object, or None
+    when the principal was built from token claims.
+    """
+
+    def __init__(self, user: User, from_cache: bool = False):
+        self.user = user
+        # True when `user` is the process-cache snapshot (read-only requests only)
+        self.from_cache = from_cache
+        self.id = user.id
+        self.username = user.username
+        self.role = user.role
+        self._allowed_buildings = None
+
+    @classmethod
+    def from_claims(cls, payload: dict):
+        principal = cls.__new__(cls)
+        principal.user = None
+        principal.id = int(payload["sub"])
+        principal.username = payload.get("username")
+        principal.role = payload.get("role")
+        buildings = payload.get("buildings")
+        principal._allowed_buildings = list(buildings) if buildings is not None else None
+        return principal
+
+    @property
+    def allowed_buildings(self):
+        if self._allowed_buildings is None:
+            self._allowed_buildings = load_allowed_buildings(self.id)
+        return self._allowed_buildings
+
+
+def _load_user(user_id: int, read_only: bool = False):
+    """
+    (user, from_cache) by id. Read-only requests are served from the process
+    cache when possible: the cached user is attached to the current session
+    without a SELECT and may be up to one TTL stale. Other requests always
+    read the row, so a deleted / changed user is seen at once.
+    """
+    values = _users_cache.get(user_id) if read_only else None
+    if values is None:
+        user = db.session.get(User, user_id, populate_existing=True)
+        if user is None:
+            return None, False
+        _users_cache.set(user_id, {key: getattr(user, key) for key in USER_COLUMNS})
+        return user, False
+
+    cached = User(**values)
+    make_transient_to_detached(cached)
+    return db.session.merge(cached, load=False), True
+
+
+def load_allowed_buildings(admin_id: int):
+    buildings = _buildings_cache.get(admin_id)
+    if buildings is None:
+        rows = AdminBuilding.query.filter_by(admin_id=admin_id).all()
+        buildings = [r.building for r in rows]
+        _buildings_cache.set(admin_id, buildings)
+    return list(buildings)
+
+
+def get_token_version(user_id: int):
+    """
+    Current users.token_version (cached per process), None if the user doesn't exist.
+    """
+    version = _versions_cache.get(user_id)
+    if version is None:
+        version = db.session.query(User.token_version).filter(User.id == user_id).scalar()
+        if version is None:
+            return None
+        _versions_cache.set(user_id, version)
+    return version
+
+
+def get_claims_principal(payload: dict):
+    """
+    Principal built from token claims when the token's `ver` is still current,
+    otherwise None (caller falls back to get_request_principal).
+    """
+    user_id = int(payload["sub"])
+    principal = g.get("principal")
+    if principal is not None and principal.id == user_id:
+        return principal
+
+    if "ver" not in payload or payload["ver"] != get_token_version(user_id):
+        return None
+
+    principal = Principal.from_claims(payload)
+    g.principal = principal
+    return principal
+
+
+def get_request_principal(user_id: int, read_only: bool = False):
+    """
+    The principal for user_id, loaded once per request (flask.g); only
+    read_only callers get the process-cached user. Returns None if the user
+    doesn't exist.
+    """
+    principal = g.get("principal")
+    if (
+        principal is not None
+        and principal.id == user_id
+        and principal.user is not None
+        and (read_only or not principal.from_cache)
+    ):
+        return principal
+
+    user, from_cache = _load_user(user_id, read_only=read_only)
+    if user is None:
+        return None
+
+    principal = Principal(user, from_cache=from_cache)
+    g.principal = principal
+    return principal
+
+
+def get_allowed_buildings(admin_id: int):
+    """
+    Allowed buildings for an admin; reuses the request principal when it's the same admin.
+    """
+    principal = g.get("principal") if has_app_context() else None
+    if principal is not None and principal.id == admin_id:
+        return principal.allowed_buildings
+    return load_allowed_buildings(admin_id)
+
+
+def invalidate_principal(user_id: int):
+    _users_cache.pop(user_id)
+    _buildings_cache.pop(user_id)
+    _versions_cache.pop(user_id)
+
+
+# ---- token version: bumped in the same flush as the change ----
+
+@event.listens_for(Session, "before_flush")
+def _bump_token_versions(session, flush_context, instances):
+    admin_ids = set()
+
+    for obj in session.dirty:
+        if not isinstance(obj, User):
+            continue
+        state = inspect(obj)
+        if any(state.attrs[field].history.has_changes() for field in TOKEN_VERSION_FIELDS):
+            # in SQL: the loaded value may be a cached snapshot, and concurrent bumps must both count
+            obj.token_version = User.token_version + 1
+
+    for obj in list(session.new) + list(session.deleted):
+        if isinstance(obj, AdminBuilding) and obj.admin_id is not None:
+            admin_ids.add(obj.admin_id)
+
+    if admin_ids:
+        session.execute(
+            update(User)
+            .where(User.id.in_(admin_ids))
+            .values(token_version=User.token_version + 1)
+            .execution_options(synchronize_session=False)
+        )
+        session.info.setdefault("principal_invalidate", set()).update(admin_ids)
+
+
+# ---- invalidation: collect touched ids at flush, drop them after commit ----
+
+@event.listens_for(Session, "after_flush")
+def _collect_principal_changes(session, flush_context):
+    touched = session.info.setdefault("principal_invalidate", set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, User) and obj.id is not None:
+            touched.add(obj.id)
+        elif isinstance(obj, AdminBuilding) and obj.admin_id is not None:
+            touched.add(obj.admin_id)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session):
+    for user_id in session.info.pop("principal_invalidate", set()):
+        invalidate_principal(user_id)
+
@@ -4,8 +4,10 @@ from jwt import ExpiredSignatureError, InvalidTokenError
 import jwt
 
 from app import db
-from app.models import User, PersonDetails
+from app.models import User
 from app.config import Config
+from app.auth.principal import get_request_principal, get_claims_principal, load_allowed_buildings
+from app.unit_lookup import resolve_unit_resident
 
 auth_bp = Blueprint("auth", __name__)
 
@@ -13,13 +15,19 @@ JWT_SECRET = Config.JWT_SECRET
 JWT_ALG = "HS256"
 JWT_EXP_MINUTES = 60 * 12  # 12 ساعة
 
+# roles whose allowed buildings are embedded in the token (stateless claims mode)
+BUILDING_CLAIM_ROLES = ("ADMIN", "ONLINE_ADMIN")
+
 def create_token(user: User):
     payload = {
         "sub": str(user.id),  # 👈 لازم string
         "username": user.username,
         "role": user.role,
+        "ver": user.token_version or 0,
         "exp": datetime.now(timezone.utc) + timedelta(minutes=JWT_EXP_MINUTES),
     }
+    if Config.JWT_STATELESS_CLAIMS and user.role in BUILDING_CLAIM_ROLES:
+        payload["buildings"] = load_allowed_buildings(user.id)
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALG)
 
 def decode_token(token: str):
@@ -86,20 +94,8 @@ def login():
 
     # Mode 2: building/floor/apartment + password (for RESIDENT accounts)
     elif building and floor and apartment:
-        details = (
-            db.session.query(PersonDetails)
-            .join(User, PersonDetails.user_id == User.id)
-            .filter(
-                User.role == "RESIDENT",
-                PersonDetails.building == building,
-                PersonDetails.floor == floor,
-                PersonDetails.apartment == apartment,
-            )
-            .first()
-        )
-
-        if details:
-            user = details.user
+        # indexed lookup + in-process unit cache (app.unit_lookup)
+        user = resolve_unit_resident(building, floor, apartment)
 
     else:
         return jsonify(
@@ -114,6 +110,10 @@ def login():
     if not user or not user.check_password(password):
         return jsonify({"message": "invalid credentials"}), 401
 
+    # upgrade hashes made with older / other parameters (PASSWORD_HASH_METHOD)
+    if user.password_needs_rehash():
+        user.set_password(password)
+
     user.last_login_at = datetime.now()
     db.session.commit()
 
@@ -157,10 +157,14 @@ def me():
         "role": user.role,
     })
 
-def get_current_user_from_request(allowed_roles=None):
+def get_current_user_from_request(allowed_roles=None, read_only=False):
     """
     Read Authorization header, decode JWT, return User object.
     If allowed_roles is provided, ensure user.role is in that list.
+
+    read_only=True (JWT_STATELESS_CLAIMS on): trust the token's role/buildings
+    while its version is current and return the Principal (id / username /
+    role) instead of a User — only for endpoints that don't touch the user row.
     """
     auth_header = request.headers.get("Authorization", "")
     if not auth_header.startswith("Bearer "):
@@ -179,11 +183,17 @@ def get_current_user_from_request(allowed_roles=None):
     except (KeyError, ValueError, TypeError):
         return None, ("invalid token payload", 401)
 
-    user = User.query.get(user_id)
-    if not user:
+    principal = None
+    if read_only and Config.JWT_STATELESS_CLAIMS:
+        principal = get_claims_principal(payload)
+
+    if principal is None:
+        # loaded once per request (flask.g) + short-TTL process cache
+        principal = get_request_principal(user_id, read_only=read_only)
+    if not principal:
         return None, ("user not found", 404)
 
-    if allowed_roles and user.role not in allowed_roles:
+    if allowed_roles and principal.role not in allowed_roles:
         return None, ("forbidden", 403)
 
-    return user, None
\ No newline at end of file
+    return principal.user or principal, None
\ No newline at end of file
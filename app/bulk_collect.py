@@ -0,0 +1,357 @@
+"""
+Server-side version of bulk_import_invoices.InvoiceBatchImporter.process_row:
+resolve units, find / create invoices and collect payments for a whole batch
+with a handful of set-wise statements per chunk instead of 3–4 HTTP calls per row.
+Per-row results have the same shape as the importer's (save_results).
+dry_run=True runs the same decisions without writing anything (a plan).
+"""
+from datetime import date, datetime
+from decimal import Decimal
+from itertools import islice
+
+from flask import current_app, jsonify
+from sqlalchemy import insert, update, tuple_
+
+from app import db
+from app.models import User, PersonDetails, MaintenanceInvoice, Payment
+from app.cash_balances import record_collection, record_invoice_collected
+from app.month_stats import add_month_delta, record_month_deltas
+from app.bulk_import_invoices import parse_import_row, import_error_result
+
+BULK_COLLECT_CHUNK_SIZE = 500
+
+# same rule as create_initial_invoices_for_resident when the row has no due_date
+DEFAULT_DUE_DAY = 5
+
+COLLECT_API_MESSAGE = "payment recorded and invoice marked as PAID"
+
+
+class RowError(Exception):
+    pass
+
+
+def payment_method_for_role(role: str) -> str:
+    if role == "ADMIN":
+        return "CASH"
+    if role == "ONLINE_ADMIN":
+        return "ONLINE"
+    raise ValueError(f"Unsupported role for collection: {role}")
+
+
+def _api_error(prefix: str, status: int, message: str) -> RowError:
+    # mirrors the importer's "<prefix>: <status> - <response body>" messages
+    body = jsonify({"message": message}).get_data(as_text=True)
+    return RowError(f"{prefix}: {status} - {body}")
+
+
+def _resolve_units(keys, allowed_buildings):
+    """
+    { (building, floor, apartment): [resident user ids] } in one query.
+    allowed_buildings=None → no building restriction.
+    """
+    if not keys:
+        return {}
+
+    q = (
+        db.session.query(PersonDetails.building, PersonDetails.floor, PersonDetails.apartment, User.id)
+        .join(User, PersonDetails.user_id == User.id)
+        .filter(
+            User.role == "RESIDENT",
+            tuple_(PersonDetails.building, PersonDetails.floor, PersonDetails.apartment).in_(list(keys)),
+        )
+        .order_by(PersonDetails.id)
+    )
+    if allowed_buildings is not None:
+        q = q.filter(PersonDetails.building.in_(allowed_buildings))
+
+    units = {}
+    for building, floor, apartment, user_id in q.all():
+        units.setdefault((building, floor, apartment), []).append(user_id)
+    return units
+
+
+def _load_invoices(months, lock: bool = True):
+    """
+    { (user_id, year, month): {id, status, amount} } for the given months, row-locked
+    (lock=True) so a concurrent collect can't pay the same invoice twice.
+    """
+    if not months:
+        return {}
+
+    q = (
+        db.session.query(MaintenanceInvoice.id, MaintenanceInvoice.user_id, MaintenanceInvoice.year,
+                         MaintenanceInvoice.month, MaintenanceInvoice.status, MaintenanceInvoice.amount)
+        .filter(tuple_(MaintenanceInvoice.user_id, MaintenanceInvoice.year, MaintenanceInvoice.month).in_(list(months)))
+    )
+    if lock:
+        q = q.with_for_update()
+    rows = q.all()
+    return {(r.user_id, r.year, r.month): {"id": r.id, "status": r.status, "amount": r.amount} for r in rows}
+
+
+def _process_chunk(chunk, collector: User, allowed_buildings, method: str, planned: dict = None):
+    """
+    chunk: list of (row_number, raw_row). Returns (per-row results, amount
+    collected); the caller commits (or rolls back) the chunk.
+
+    planned: dry run only — invoice state decided by earlier chunks, used
+    instead of the DB (nothing was written) and updated with this chunk's.
+    """
+    dry_run = planned is not None
+    results = {}
+    parsed = {}
+
+    for row_number, row in chunk:
+        try:
+            parsed[row_number] = parse_import_row(row)
+        except Exception as exc:
+            results[row_number] = import_error_result(row_number, row, exc)
+
+    units = _resolve_units(
+        {(p["building"], p["floor"], p["apartment"]) for p in parsed.values()},
+        allowed_buildings,
+    )
+
+    resident_ids = {}
+    for row_number, p in parsed.items():
+        user_ids = units.get((p["building"], p["floor"], p["apartment"]), [])
+        if len(user_ids) == 1:
+            resident_ids[row_number] = user_ids[0]
+
+    months = {(resident_ids[n], parsed[n]["year"], parsed[n]["month"]) for n in resident_ids}
+    invoices = _load_invoices(months, lock=not dry_run)
+    if dry_run:
+        invoices.update({key: planned[key] for key in months if key in planned})
+
+    # 1) decide every row in order, against the in-memory invoice state
+    new_invoices = {}   # (user_id, year, month) → insert values
+    to_collect = []     # (row_number, key, created_invoice, parsed row)
+    already_paid = []   # (row_number, raw row, key, parsed row)
+
+    for row_number, row in chunk:
+        if row_number in results:
+            continue
+        p = parsed[row_number]
+        where = f"building={p['building']}, floor={p['floor']}, apartment={p['apartment']}"
+
+        try:
+            user_ids = units.get((p["building"], p["floor"], p["apartment"]), [])
+            if not user_ids:
+                raise RowError(f"Resident not found for {where}")
+            if len(user_ids) > 1:
+                raise RowError(f"Multiple residents found for {where}")
+            user_id = user_ids[0]
+
+            key = (user_id, p["year"], p["month"])
+            invoice = invoices.get(key)
+            created_invoice = False
+
+            if invoice is None:
+                if not p["create_invoice_if_missing"]:
+                    raise RowError(
+                        f"No invoice found for resident {p['building']}/{p['floor']}/{p['apartment']} "
+                        f"for {p['year']}-{p['month']:02d}, and create_invoice_if_missing is FALSE"
+                    )
+
+                if p["due_date"]:
+                    try:
+                        due_date = date.fromisoformat(p["due_date"])
+                    except ValueError:
+                        raise _api_error(
+                            f"Failed to create invoice for user_id={user_id}, year={p['year']}, month={p['month']}",
+                            400,
+                            "invalid due_date format, expected YYYY-MM-DD",
+                        )
+                else:
+                    due_date = date(p["year"], p["month"], DEFAULT_DUE_DAY)
+
+                new_invoices[key] = {
+                    "user_id": user_id,
+                    "year": p["year"],
+                    "month": p["month"],
+                    "amount": Decimal(str(p["invoice_amount"])),
+                    "status": "PENDING",
+                    "due_date": due_date,
+                    "notes": p["invoice_notes"],
+                }
+                invoice = invoices[key] = {"id": None, "status": "PENDING", "amount": new_invoices[key]["amount"]}
+                created_invoice = True
+
+            if invoice["status"] == "PAID":
+                # finished after the inserts: the invoice may have been created by an earlier row
+                already_paid.append((row_number, row, key, p))
+                continue
+
+            if invoice["status"] == "PENDING_CONFIRMATION":
+                raise _api_error(
+                    f"Failed to collect payment for invoice_id={invoice['id']}",
+                    400,
+                    "لا يمكن تحصيل هذا الايصال نقداً لأنه يحتوي على عملية دفع إلكتروني قيد المراجعة.",
+                )
+
+            invoice["status"] = "PAID"
+            to_collect.append((row_number, key, created_invoice, p))
+
+        except RowError as exc:
+            results[row_number] = import_error_result(row_number, row, exc)
+
+    collected_amount = sum(Decimal(str(p["payment_amount"])) for _, _, _, p in to_collect)
+
+    # 2) write: missing invoices, payments, invoice statuses, collector balance
+    if dry_run:
+        planned.update(invoices)
+    elif new_invoices:
+        created = db.session.execute(
+            insert(MaintenanceInvoice).returning(
+                MaintenanceInvoice.id, MaintenanceInvoice.user_id, MaintenanceInvoice.year, MaintenanceInvoice.month
+            ),
+            list(new_invoices.values()),
+        )
+        for r in created:
+            invoices[(r.user_id, r.year, r.month)]["id"] = r.id
+
+    if to_collect and not dry_run:
+        now = datetime.now()
+        invoice_ids = [invoices[key]["id"] for _, key, _, _ in to_collect]
+
+        db.session.execute(
+            insert(Payment),
+            [
+                {
+                    "user_id": key[0],
+                    "invoice_id": invoices[key]["id"],
+                    "amount": Decimal(str(p["payment_amount"])),
+                    "method": method,
+                    "notes": p["payment_notes"],
+                    "collected_by_admin_id": collector.id,
+                    "created_at": now,
+                }
+                for _, key, _, p in to_collect
+            ],
+        )
+        db.session.execute(
+            update(MaintenanceInvoice)
+            .where(MaintenanceInvoice.id.in_(invoice_ids))
+            .values(status="PAID", paid_date=now)
+            .execution_options(synchronize_session=False)
+        )
+        record_collection(collector.id, collected_amount, count=len(to_collect))
+
+        collected_by_invoice = {}
+        for _, key, _, p in to_collect:
+            invoice_id = invoices[key]["id"]
+            collected_by_invoice[invoice_id] = collected_by_invoice.get(invoice_id, 0) + Decimal(str(p["payment_amount"]))
+        record_invoice_collected(collected_by_invoice)
+
+    if not dry_run:
+        _record_month_stats(units, new_invoices, [(key, invoices[key]["amount"]) for _, key, _, _ in to_collect])
+
+    for row_number, key, created_invoice, p in to_collect:
+        results[row_number] = {
+            "success": True,
+            "action": "CREATED_AND_COLLECTED" if created_invoice else "COLLECTED",
+            "resident_id": key[0],
+            "invoice_id": invoices[key]["id"],
+            "year": p["year"],
+            "month": p["month"],
+            "created_invoice": created_invoice,
+            "payment_method_used": method,
+            "api_message": COLLECT_API_MESSAGE,
+            "row_number": row_number,
+        }
+
+    # invoice ids are only known now for invoices created in this chunk
+    for row_number, row, key, p in already_paid:
+        if not p["skip_if_paid"]:
+            # no id yet in a dry run when an earlier row creates the invoice
+            invoice_id = invoices[key]["id"] or "(created by an earlier row)"
+            error = RowError(f"Invoice {invoice_id} is already PAID")
+            results[row_number] = import_error_result(row_number, row, error)
+            continue
+        results[row_number] = {
+            "success": True,
+            "action": "SKIPPED_ALREADY_PAID",
+            "resident_id": key[0],
+            "invoice_id": invoices[key]["id"],
+            "year": p["year"],
+            "month": p["month"],
+            "message": "Invoice already paid, skipped.",
+            "payment_method_used": method,
+            "row_number": row_number,
+        }
+
+    return [results[row_number] for row_number, _ in chunk], collected_amount
+
+
+def _record_month_stats(units, new_invoices, collected):
+    """
+    building_month_stats deltas for this chunk's inserted invoices and
+    collected (now PAID) ones — the set-wise writes bypass the ORM hooks.
+    """
+    building_of = {user_id: key[0] for key, user_ids in units.items() for user_id in user_ids}
+    deltas = {}
+    for user_id, year, month in new_invoices:
+        add_month_delta(deltas, (building_of[user_id], year, month), unit_count=1)
+    for (user_id, year, month), amount in collected:
+        add_month_delta(deltas, (building_of[user_id], year, month), paid_count=1, paid_amount=amount)
+    record_month_deltas(deltas)
+
+
+def bulk_collect(
+    rows,
+    collector: User,
+    allowed_buildings=None,
+    chunk_size: int = BULK_COLLECT_CHUNK_SIZE,
+    dry_run: bool = False,
+):
+    """
+    rows: iterable of (row_number, raw_row dict) in import order; consumed
+    chunk by chunk, so a CSV reader can be streamed straight in.
+    allowed_buildings: restrict residents to these buildings (ADMIN), None = all.
+    dry_run: decide every row (same results / actions) but write nothing.
+
+    Each chunk is its own transaction; if a chunk fails as a whole (e.g. a
+    concurrent insert of the same invoice) it is rolled back and all its rows
+    are reported as errors, earlier chunks stay committed.
+
+    Returns (results, summary).
+    """
+    method = payment_method_for_role(collector.role)
+    planned = {} if dry_run else None
+    results = []
+    collected_amount = Decimal("0")
+
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        try:
+            chunk_results, chunk_amount = _process_chunk(chunk, collector, allowed_buildings, method, planned)
+            if dry_run:
+                db.session.rollback()
+            else:
+                db.session.commit()
+            collected_amount += chunk_amount
+        except Exception as exc:
+            db.session.rollback()
+            current_app.logger.exception("bulk collect chunk starting at row %s failed", chunk[0][0])
+            chunk_results = [import_error_result(row_number, row, exc) for row_number, row in chunk]
+        results.extend(chunk_results)
+
+    actions = {}
+    for r in results:
+        actions[r["action"]] = actions.get(r["action"], 0) + 1
+    succeeded = sum(1 for r in results if r.get("success"))
+
+    summary = {
+        "dry_run": dry_run,
+        "total": len(results),
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded,
+        "actions": actions,
+        "invoices_created": actions.get("CREATED_AND_COLLECTED", 0),
+        "payments_collected": actions.get("CREATED_AND_COLLECTED", 0) + actions.get("COLLECTED", 0),
+        "collected_amount": float(collected_amount),
+    }
+    return results, summary
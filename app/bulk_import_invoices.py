@@ -1,10 +1,18 @@
+import argparse
 import csv
+import hashlib
+import json
+import os
 import sys
+import threading
 import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
 import requests
+from requests.adapters import HTTPAdapter
 
 
 @dataclass
@@ -17,6 +25,74 @@ class ImportConfig:
     verify_ssl: bool = True
     retry_count: int = 2
     retry_sleep_sec: float = 1.5
+    # rows of different units processed at once (rows of one unit stay sequential)
+    workers: int = 1
+    # JSONL file of finished rows; a rerun skips rows already done successfully
+    checkpoint_path: Optional[str] = None
+
+
+class MultipartFileBody:
+    """
+    multipart/form-data body with one file field, read from disk as it is
+    sent (requests streams file-like bodies block by block), so a large CSV
+    is never held in memory. Rewindable with seek(0) for retries.
+    """
+
+    def __init__(self, path: str, field: str = "file", content_type: str = "application/octet-stream"):
+        boundary = uuid.uuid4().hex
+        filename = os.path.basename(path).replace('"', "")
+        self.path = path
+        self.content_type = f"multipart/form-data; boundary={boundary}"
+        self._head = (
+            f"--{boundary}\r\n"
+            f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+            f"Content-Type: {content_type}\r\n\r\n"
+        ).encode("utf-8")
+        self._tail = f"\r\n--{boundary}--\r\n".encode("ascii")
+        # requests reads `len` for the Content-Length header
+        self.len = len(self._head) + os.path.getsize(path) + len(self._tail)
+        self._file = None
+        self._position = 0
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        if offset != 0 or whence != 0:
+            raise OSError("MultipartFileBody can only be rewound to the start")
+        self.close()
+        self._position = 0
+        return 0
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            size = self.len
+        out = b""
+        while len(out) < size and self._position < self.len:
+            want = size - len(out)
+            file_end = self.len - len(self._tail)
+            if self._position < len(self._head):
+                chunk = self._head[self._position:self._position + want]
+            elif self._position < file_end:
+                if self._file is None:
+                    self._file = open(self.path, "rb")
+                    self._file.seek(self._position - len(self._head))
+                chunk = self._file.read(min(want, file_end - self._position))
+                if not chunk:
+                    raise OSError(f"{self.path} changed size while being sent")
+            else:
+                start = self._position - file_end
+                chunk = self._tail[start:start + want]
+            out += chunk
+            self._position += len(chunk)
+        if self._position >= self.len:
+            self.close()
+        return out
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
 
 
 class InvoiceBatchImporter:
@@ -30,14 +106,38 @@ class InvoiceBatchImporter:
         self.token: Optional[str] = None
         self.role: Optional[str] = None
 
+        # one requests.Session per worker thread (Session isn't thread-safe)
+        self._local = threading.local()
+
+        # per-unit lookups reused across rows; each unit is handled by one worker at a time
+        self._residents: Dict[Tuple[str, str, str], Dict[str, Any]] = {}
+        self._invoices: Dict[int, List[Dict[str, Any]]] = {}
+
+        self._checkpoint_lock = threading.Lock()
+
+    def _session(self) -> requests.Session:
+        if self.config.workers <= 1:
+            return self.session
+
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            session.mount("https://", HTTPAdapter(pool_maxsize=1))
+            session.mount("http://", HTTPAdapter(pool_maxsize=1))
+            session.headers.update(self.session.headers)
+            self._local.session = session
+        return session
+
     def _url(self, path: str) -> str:
         return f"{self.config.base_url.rstrip('/')}{path}"
 
     def _request(self, method: str, path: str, **kwargs) -> requests.Response:
         last_exc = None
         for attempt in range(self.config.retry_count + 1):
+            if isinstance(kwargs.get("data"), MultipartFileBody):
+                kwargs["data"].seek(0)  # a retry resends the whole body
             try:
-                return self.session.request(
+                return self._session().request(
                     method=method,
                     url=self._url(path),
                     timeout=self.config.timeout,
@@ -113,6 +213,11 @@ class InvoiceBatchImporter:
         raise RuntimeError(f"Unsupported role for collection: {self.role}")
 
     def find_resident(self, building: str, floor: str, apartment: str) -> Dict[str, Any]:
+        key = (building, floor, apartment)
+        cached = self._residents.get(key)
+        if cached is not None:
+            return cached
+
         resp = self._request(
             "GET",
             "/admin/residents",
@@ -140,9 +245,18 @@ class InvoiceBatchImporter:
                 f"Multiple residents found for building={building}, floor={floor}, apartment={apartment}"
             )
 
+        self._residents[key] = residents[0]
         return residents[0]
 
     def get_resident_invoices(self, user_id: int) -> List[Dict[str, Any]]:
+        """
+        Cached per resident: later rows of the same unit see invoices created /
+        paid by earlier rows through the updates in process_row.
+        """
+        cached = self._invoices.get(user_id)
+        if cached is not None:
+            return cached
+
         resp = self._request("GET", f"/admin/residents/{user_id}/invoices")
 
         if resp.status_code != 200:
@@ -152,7 +266,9 @@ class InvoiceBatchImporter:
             )
 
         payload = resp.json()
-        return payload.get("invoices", [])
+        invoices = payload.get("invoices", [])
+        self._invoices[user_id] = invoices
+        return invoices
 
     @staticmethod
     def find_invoice_for_month(
@@ -225,33 +341,19 @@ class InvoiceBatchImporter:
         return resp.json()
 
     def process_row(self, row: Dict[str, str]) -> Dict[str, Any]:
-        building = str(row.get("building", "")).strip()
-        floor = str(row.get("floor", "")).strip()
-        apartment = str(row.get("apartment", "")).strip()
-
-        if not building or not floor or not apartment:
-            raise ValueError("building, floor, apartment are required")
-
-        year = self._to_int(row.get("year"), "year")
-        month = self._to_int(row.get("month"), "month")
-        if not 1 <= month <= 12:
-            raise ValueError(f"Invalid month: {month}")
-
-        invoice_amount = self._to_float(row.get("invoice_amount"), "invoice_amount")
-        payment_amount = self._to_float(row.get("payment_amount"), "payment_amount")
-
-        due_date = (row.get("due_date") or "").strip() or None
-        invoice_notes = (row.get("invoice_notes") or "").strip() or None
-        payment_notes = (row.get("payment_notes") or "").strip() or None
-
-        create_invoice_if_missing = self._to_bool(
-            row.get("create_invoice_if_missing"),
-            default=True,
-        )
-        skip_if_paid = self._to_bool(
-            row.get("skip_if_paid"),
-            default=True,
-        )
+        parsed = parse_import_row(row)
+        building = parsed["building"]
+        floor = parsed["floor"]
+        apartment = parsed["apartment"]
+        year = parsed["year"]
+        month = parsed["month"]
+        invoice_amount = parsed["invoice_amount"]
+        payment_amount = parsed["payment_amount"]
+        due_date = parsed["due_date"]
+        invoice_notes = parsed["invoice_notes"]
+        payment_notes = parsed["payment_notes"]
+        create_invoice_if_missing = parsed["create_invoice_if_missing"]
+        skip_if_paid = parsed["skip_if_paid"]
 
         resident = self.find_resident(building, floor, apartment)
         user_id = resident["id"]
@@ -276,6 +378,7 @@ class InvoiceBatchImporter:
                 due_date=due_date,
                 notes=invoice_notes,
             )
+            invoices.append(invoice)
             created_invoice = True
 
         invoice_id = invoice["id"]
@@ -301,6 +404,7 @@ class InvoiceBatchImporter:
             amount=payment_amount,
             notes=payment_notes,
         )
+        invoice.update(collect_result.get("invoice") or {"status": "PAID"})
 
         return {
             "success": True,
@@ -314,98 +418,269 @@ class InvoiceBatchImporter:
             "api_message": collect_result.get("message"),
         }
 
+    def _run_row(self, row_number: int, row: Dict[str, str]) -> Dict[str, Any]:
+        try:
+            result = self.process_row(row)
+            result["row_number"] = row_number
+            print(
+                f"[ROW {row_number}] SUCCESS - {result['action']} "
+                f"(invoice_id={result.get('invoice_id')}, method={result.get('payment_method_used')})"
+            )
+        except Exception as exc:
+            result = import_error_result(row_number, row, exc)
+            print(f"[ROW {row_number}] ERROR - {exc}")
+
+        self._save_checkpoint(row_number, row, result)
+        return result
+
+    def _load_checkpoint(self) -> Dict[int, Dict[str, Any]]:
+        """
+        { row_number: result } of rows already done successfully in a previous
+        run. A row only counts if its content is unchanged (same row hash).
+        """
+        path = self.config.checkpoint_path
+        if not path or not os.path.exists(path):
+            return {}
+
+        done: Dict[int, Dict[str, Any]] = {}
+        with open(path, mode="r", encoding="utf-8") as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # half-written last line after a crash
+                if entry.get("result", {}).get("success"):
+                    done[entry["row_number"]] = entry
+                else:
+                    done.pop(entry.get("row_number"), None)
+        return done
+
+    def _save_checkpoint(self, row_number: int, row: Dict[str, str], result: Dict[str, Any]) -> None:
+        if not self.config.checkpoint_path:
+            return
+
+        line = json.dumps({"row_number": row_number, "row_hash": row_hash(row), "result": result})
+        with self._checkpoint_lock:
+            with open(self.config.checkpoint_path, mode="a", encoding="utf-8") as file:
+                file.write(line + "\n")
+                file.flush()
+                os.fsync(file.fileno())
+
     def process_csv(self) -> List[Dict[str, Any]]:
         self.login()
 
-        results: List[Dict[str, Any]] = []
-
         with open(self.config.csv_path, mode="r", encoding="utf-8-sig", newline="") as file:
             reader = csv.DictReader(file)
+            check_import_columns(reader.fieldnames)
+            rows = list(enumerate(reader, start=2))
+
+        done = self._load_checkpoint()
+        results: Dict[int, Dict[str, Any]] = {}
+        pending = []
+
+        for row_number, row in rows:
+            entry = done.get(row_number)
+            if entry and entry.get("row_hash") == row_hash(row):
+                results[row_number] = entry["result"]
+            else:
+                pending.append((row_number, row))
+
+        if done:
+            print(f"Resuming from {self.config.checkpoint_path}: {len(results)} row(s) already done")
+
+        if self.config.workers <= 1:
+            for row_number, row in pending:
+                results[row_number] = self._run_row(row_number, row)
+        else:
+            # rows of one unit go to the same task, in file order, so a unit is never raced
+            groups: Dict[Tuple[str, str, str], List[Tuple[int, Dict[str, str]]]] = {}
+            for row_number, row in pending:
+                key = tuple(str(row.get(k, "")).strip() for k in ("building", "floor", "apartment"))
+                groups.setdefault(key, []).append((row_number, row))
+
+            def run_group(group):
+                return [(row_number, self._run_row(row_number, row)) for row_number, row in group]
+
+            with ThreadPoolExecutor(max_workers=self.config.workers) as pool:
+                for group_results in pool.map(run_group, groups.values()):
+                    results.update(group_results)
+
+        return [results[row_number] for row_number, _ in rows]
+
+
+    def dry_run(self) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """
+        Validate and plan the whole CSV without writing anything: the file is
+        sent once to POST /admin/bulk/collect?dry_run=1, which resolves units
+        and invoices in batches server-side. Returns (per-row plan, summary).
+        """
+        self.login()
 
-            required_columns = {
-                "building",
-                "floor",
-                "apartment",
-                "year",
-                "month",
-                "invoice_amount",
-                "payment_amount",
-            }
+        # streamed from disk, not read into memory first
+        body = MultipartFileBody(self.config.csv_path, content_type="text/csv")
+        try:
+            resp = self._request(
+                "POST",
+                "/admin/bulk/collect",
+                params={"dry_run": "1"},
+                data=body,
+                headers={"Content-Type": body.content_type},
+            )
+        finally:
+            body.close()
 
-            if not reader.fieldnames:
-                raise ValueError("CSV file has no header row")
+        if resp.status_code != 200:
+            raise RuntimeError(f"Dry run failed: {resp.status_code} - {resp.text}")
 
-            missing = required_columns - set(reader.fieldnames)
-            if missing:
-                raise ValueError(f"CSV is missing required columns: {sorted(missing)}")
+        data = resp.json()
+        return data["results"], data["summary"]
+
+
+def print_plan(results: List[Dict[str, Any]], summary: Dict[str, Any]) -> None:
+    print("\n========== DRY RUN PLAN (nothing written) ==========")
+    for action, count in sorted(summary.get("actions", {}).items()):
+        print(f"{action:<22}: {count}")
+    print(f"Invoices to create    : {summary.get('invoices_created', 0)}")
+    print(f"Payments to collect   : {summary.get('payments_collected', 0)}")
+    print(f"Amount to collect     : {summary.get('collected_amount', 0):.2f}")
+    print(f"Rows                  : {summary.get('total', len(results))}")
+
+    errors = [r for r in results if not r.get("success")]
+    if errors:
+        print(f"\n{len(errors)} row(s) would fail:")
+        for r in errors:
+            print(f"[ROW {r.get('row_number')}] {r.get('error')}")
+
+
+def row_hash(row: Dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(row, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+REQUIRED_COLUMNS = {
+    "building",
+    "floor",
+    "apartment",
+    "year",
+    "month",
+    "invoice_amount",
+    "payment_amount",
+}
+
+
+def check_import_columns(fieldnames) -> None:
+    if not fieldnames:
+        raise ValueError("CSV file has no header row")
+
+    missing = REQUIRED_COLUMNS - set(fieldnames)
+    if missing:
+        raise ValueError(f"CSV is missing required columns: {sorted(missing)}")
+
+
+def parse_import_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Validate / normalize one CSV row (shared with POST /api/admin/bulk/collect).
+    Raises ValueError with the same messages the importer always reported.
+    """
+    building = str(row.get("building", "")).strip()
+    floor = str(row.get("floor", "")).strip()
+    apartment = str(row.get("apartment", "")).strip()
+
+    if not building or not floor or not apartment:
+        raise ValueError("building, floor, apartment are required")
+
+    year = InvoiceBatchImporter._to_int(row.get("year"), "year")
+    month = InvoiceBatchImporter._to_int(row.get("month"), "month")
+    if not 1 <= month <= 12:
+        raise ValueError(f"Invalid month: {month}")
+
+    return {
+        "building": building,
+        "floor": floor,
+        "apartment": apartment,
+        "year": year,
+        "month": month,
+        "invoice_amount": InvoiceBatchImporter._to_float(row.get("invoice_amount"), "invoice_amount"),
+        "payment_amount": InvoiceBatchImporter._to_float(row.get("payment_amount"), "payment_amount"),
+        "due_date": (str(row.get("due_date") or "")).strip() or None,
+        "invoice_notes": (str(row.get("invoice_notes") or "")).strip() or None,
+        "payment_notes": (str(row.get("payment_notes") or "")).strip() or None,
+        "create_invoice_if_missing": InvoiceBatchImporter._to_bool(
+            row.get("create_invoice_if_missing"),
+            default=True,
+        ),
+        "skip_if_paid": InvoiceBatchImporter._to_bool(
+            row.get("skip_if_paid"),
+            default=True,
+        ),
+    }
 
-            for row_number, row in enumerate(reader, start=2):
-                try:
-                    result = self.process_row(row)
-                    result["row_number"] = row_number
-                    results.append(result)
-                    print(
-                        f"[ROW {row_number}] SUCCESS - {result['action']} "
-                        f"(invoice_id={result.get('invoice_id')}, method={result.get('payment_method_used')})"
-                    )
-                except Exception as exc:
-                    error_result = {
-                        "success": False,
-                        "row_number": row_number,
-                        "action": "ERROR",
-                        "error": str(exc),
-                        "building": row.get("building"),
-                        "floor": row.get("floor"),
-                        "apartment": row.get("apartment"),
-                        "year": row.get("year"),
-                        "month": row.get("month"),
-                    }
-                    results.append(error_result)
-                    print(f"[ROW {row_number}] ERROR - {exc}")
-
-        return results
 
+def import_error_result(row_number: int, row: Dict[str, Any], exc: Exception) -> Dict[str, Any]:
+    return {
+        "success": False,
+        "row_number": row_number,
+        "action": "ERROR",
+        "error": str(exc),
+        "building": row.get("building"),
+        "floor": row.get("floor"),
+        "apartment": row.get("apartment"),
+        "year": row.get("year"),
+        "month": row.get("month"),
+    }
 
-def save_results(results: List[Dict[str, Any]], output_csv: str = "import_results.csv") -> None:
+
+def write_results(results: List[Dict[str, Any]], file) -> None:
     fieldnames = sorted({key for row in results for key in row.keys()})
 
+    writer = csv.DictWriter(file, fieldnames=fieldnames)
+    writer.writeheader()
+    writer.writerows(results)
+
+
+def save_results(results: List[Dict[str, Any]], output_csv: str = "import_results.csv") -> None:
     with open(output_csv, mode="w", encoding="utf-8", newline="") as file:
-        writer = csv.DictWriter(file, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(results)
+        write_results(results, file)
 
 
 def main() -> None:
-    if len(sys.argv) < 5:
-        print(
-            "Usage:\n"
-            "python bulk_import_invoices.py <BASE_URL> <USERNAME> <PASSWORD> <CSV_PATH>\n\n"
-            "Example:\n"
-            "python bulk_import_invoices.py "
-            "http://127.0.0.1:5000 "
-            "online_admin "
-            "your_password "
-            "invoices_import.csv"
-        )
-        sys.exit(1)
-
-    base_url = sys.argv[1]
-    username = sys.argv[2]
-    password = sys.argv[3]
-    csv_path = sys.argv[4]
+    parser = argparse.ArgumentParser(
+        description="Import invoices / collect payments from a CSV through the API.",
+        epilog=(
+            "Example: python bulk_import_invoices.py http://127.0.0.1:5000 online_admin "
+            "your_password invoices_import.csv --workers 8 --checkpoint invoices_import.checkpoint.jsonl"
+        ),
+    )
+    parser.add_argument("base_url")
+    parser.add_argument("username")
+    parser.add_argument("password")
+    parser.add_argument("csv_path")
+    parser.add_argument("--workers", type=int, default=1, help="units processed concurrently (default 1)")
+    parser.add_argument("--checkpoint", default=None, help="JSONL checkpoint file; rerun to resume")
+    parser.add_argument("--dry-run", action="store_true", help="validate and print the plan, write nothing")
+    args = parser.parse_args()
 
     config = ImportConfig(
-        base_url=base_url,
-        username=username,
-        password=password,
-        csv_path=csv_path,
+        base_url=args.base_url,
+        username=args.username,
+        password=args.password,
+        csv_path=args.csv_path,
         timeout=30,
         verify_ssl=True,
         retry_count=2,
         retry_sleep_sec=1.5,
+        workers=max(1, args.workers),
+        checkpoint_path=args.checkpoint,
     )
 
     importer = InvoiceBatchImporter(config)
+
+    if args.dry_run:
+        results, summary = importer.dry_run()
+        save_results(results, "import_plan.csv")
+        print_plan(results, summary)
+        print("Detailed plan saved to import_plan.csv")
+        return
+
     results = importer.process_csv()
     save_results(results)
 
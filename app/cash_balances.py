@@ -0,0 +1,259 @@
+from decimal import Decimal
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import func, update, bindparam
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models import AdminCashBalance, MaintenanceInvoice, Payment, Settlement
+
+cash_balances_cli = AppGroup("cash-balances", help="Maintain admin_cash_balances.")
+
+
+def _to_decimal(value) -> Decimal:
+    return Decimal(str(value or 0))
+
+
+def _apply_delta(admin_id: int, collected=0, settled=0, count: int = 0):
+    """
+    Add deltas to the admin's balance row in the current transaction.
+    Uses an atomic UPDATE ... SET x = x + delta, creating the row if missing.
+    """
+    collected = _to_decimal(collected)
+    settled = _to_decimal(settled)
+
+    values = {
+        AdminCashBalance.collected_amount: AdminCashBalance.collected_amount + collected,
+        AdminCashBalance.settled_amount: AdminCashBalance.settled_amount + settled,
+        AdminCashBalance.payments_count: AdminCashBalance.payments_count + count,
+    }
+
+    updated = (
+        db.session.query(AdminCashBalance)
+        .filter(AdminCashBalance.admin_id == admin_id)
+        .update(values, synchronize_session=False)
+    )
+    if updated:
+        return
+
+    try:
+        with db.session.begin_nested():
+            db.session.add(
+                AdminCashBalance(
+                    admin_id=admin_id,
+                    collected_amount=collected,
+                    settled_amount=settled,
+                    payments_count=count,
+                )
+            )
+    except IntegrityError:
+        # another worker created the row first → just add on top of it
+        (
+            db.session.query(AdminCashBalance)
+            .filter(AdminCashBalance.admin_id == admin_id)
+            .update(values, synchronize_session=False)
+        )
+
+
+def record_collection(admin_id: int, amount, count: int = 1):
+    """
+    A payment of `amount` was collected by this admin.
+    """
+    _apply_delta(admin_id, collected=amount, count=count)
+
+
+def record_settlement(admin_id: int, amount):
+    """
+    The admin handed `amount` over to the treasurer.
+    """
+    _apply_delta(admin_id, settled=amount)
+
+
+def record_invoice_collected(amounts: dict):
+    """
+    Payments were recorded against invoices: { invoice_id: amount }.
+    Adds them to maintenance_invoices.collected_amount (atomic UPDATE ... + delta).
+    """
+    params = [
+        {"invoice_id": invoice_id, "delta": _to_decimal(amount)}
+        for invoice_id, amount in sorted(amounts.items())
+    ]
+    if not params:
+        return
+    db.session.execute(
+        update(MaintenanceInvoice.__table__)
+        .where(MaintenanceInvoice.__table__.c.id == bindparam("invoice_id"))
+        .values(collected_amount=MaintenanceInvoice.__table__.c.collected_amount + bindparam("delta")),
+        params,
+    )
+
+
+def record_invoice_payments_removed(invoice_id: int):
+    """
+    Call BEFORE deleting an invoice's payments: reverses them on each collector's
+    balance and resets the invoice's collected_amount.
+    """
+    rows = (
+        db.session.query(
+            Payment.collected_by_admin_id.label("admin_id"),
+            func.coalesce(func.sum(Payment.amount), 0).label("amount"),
+            func.count(Payment.id).label("count"),
+        )
+        .filter(Payment.invoice_id == invoice_id)
+        .group_by(Payment.collected_by_admin_id)
+        .all()
+    )
+    for r in rows:
+        _apply_delta(r.admin_id, collected=-_to_decimal(r.amount), count=-int(r.count))
+
+    db.session.execute(
+        update(MaintenanceInvoice.__table__)
+        .where(MaintenanceInvoice.__table__.c.id == invoice_id)
+        .values(collected_amount=0)
+    )
+
+
+def get_admin_cash_balance(admin_id: int, for_update: bool = False):
+    """
+    Returns { total_amount, settled_amount, outstanding_amount, payments_count }.
+    for_update=True locks the row (Postgres) until the transaction ends.
+    """
+    q = db.session.query(AdminCashBalance).filter(AdminCashBalance.admin_id == admin_id)
+    if for_update:
+        q = q.with_for_update()
+    balance = q.first()
+
+    total_amount = float(balance.collected_amount) if balance else 0.0
+    settled_amount = float(balance.settled_amount) if balance else 0.0
+
+    return {
+        "total_amount": total_amount,
+        "settled_amount": settled_amount,
+        "outstanding_amount": total_amount - settled_amount,
+        "payments_count": int(balance.payments_count) if balance else 0,
+    }
+
+
+def rebuild_admin_cash_balances(apply: bool = True):
+    """
+    Recompute every balance from payments/settlements history and compare
+    with the maintained table. Returns a list of drifted rows; when apply=True
+    the table is corrected (caller commits).
+    """
+    expected = {}
+
+    payment_rows = (
+        db.session.query(
+            Payment.collected_by_admin_id,
+            func.coalesce(func.sum(Payment.amount), 0),
+            func.count(Payment.id),
+        )
+        .group_by(Payment.collected_by_admin_id)
+        .all()
+    )
+    for admin_id, amount, count in payment_rows:
+        expected[admin_id] = [_to_decimal(amount), Decimal("0"), int(count)]
+
+    settlement_rows = (
+        db.session.query(Settlement.admin_id, func.coalesce(func.sum(Settlement.amount), 0))
+        .group_by(Settlement.admin_id)
+        .all()
+    )
+    for admin_id, amount in settlement_rows:
+        expected.setdefault(admin_id, [Decimal("0"), Decimal("0"), 0])[1] = _to_decimal(amount)
+
+    current = {b.admin_id: b for b in AdminCashBalance.query.with_for_update().all()}
+
+    drift = []
+    for admin_id in sorted(set(expected) | set(current)):
+        want = tuple(expected.get(admin_id, (Decimal("0"), Decimal("0"), 0)))
+        balance = current.get(admin_id)
+
+        have = (
+            (_to_decimal(balance.collected_amount), _to_decimal(balance.settled_amount), int(balance.payments_count))
+            if balance
+            else (Decimal("0"), Decimal("0"), 0)
+        )
+        if have == want:
+            continue
+
+        drift.append({
+            "admin_id": admin_id,
+            "collected_amount": [float(have[0]), float(want[0])],
+            "settled_amount": [float(have[1]), float(want[1])],
+            "payments_count": [have[2], want[2]],
+        })
+
+        if not apply:
+            continue
+
+        if balance is None:
+            balance = AdminCashBalance(admin_id=admin_id)
+            db.session.add(balance)
+        balance.collected_amount, balance.settled_amount, balance.payments_count = want
+
+    return drift
+
+
+def rebuild_invoice_collected(apply: bool = True):
+    """
+    Recompute maintenance_invoices.collected_amount from payments. Returns
+    the drifted invoices [{invoice_id, collected_amount: [have, want]}];
+    when apply=True they are corrected (caller commits).
+    """
+    paid = (
+        db.session.query(Payment.invoice_id, func.sum(Payment.amount).label("amount"))
+        .group_by(Payment.invoice_id)
+        .subquery()
+    )
+    want = func.coalesce(paid.c.amount, 0)
+    rows = (
+        db.session.query(MaintenanceInvoice.id, MaintenanceInvoice.collected_amount, want)
+        .outerjoin(paid, paid.c.invoice_id == MaintenanceInvoice.id)
+        .filter(MaintenanceInvoice.collected_amount != want)
+        .order_by(MaintenanceInvoice.id)
+        .all()
+    )
+
+    drift = [
+        {"invoice_id": invoice_id, "collected_amount": [float(have), float(expected)]}
+        for invoice_id, have, expected in rows
+    ]
+    if apply and rows:
+        db.session.execute(
+            update(MaintenanceInvoice.__table__)
+            .where(MaintenanceInvoice.__table__.c.id == bindparam("invoice_id"))
+            .values(collected_amount=bindparam("collected")),
+            [{"invoice_id": invoice_id, "collected": _to_decimal(expected)} for invoice_id, _, expected in rows],
+        )
+    return drift
+
+
+@cash_balances_cli.command("reconcile")
+@click.option("--dry-run", is_flag=True, help="Only report drift, don't fix it.")
+def reconcile_command(dry_run: bool):
+    """Rebuild admin_cash_balances and invoice collected amounts from payments/settlements and report drift."""
+    drift = rebuild_admin_cash_balances(apply=not dry_run)
+    invoice_drift = rebuild_invoice_collected(apply=not dry_run)
+
+    if dry_run:
+        db.session.rollback()
+    else:
+        db.session.commit()
+
+    for d in drift:
+        click.echo(
+            f"admin {d['admin_id']}: "
+            f"collected {d['collected_amount'][0]:.2f} -> {d['collected_amount'][1]:.2f}, "
+            f"settled {d['settled_amount'][0]:.2f} -> {d['settled_amount'][1]:.2f}, "
+            f"count {d['payments_count'][0]} -> {d['payments_count'][1]}"
+        )
+    click.echo(f"{len(drift)} admin balance(s) drifted" + (" (not fixed, dry run)" if dry_run else ""))
+
+    for d in invoice_drift:
+        click.echo(
+            f"invoice {d['invoice_id']}: "
+            f"collected {d['collected_amount'][0]:.2f} -> {d['collected_amount'][1]:.2f}"
+        )
+    click.echo(f"{len(invoice_drift)} invoice(s) drifted" + (" (not fixed, dry run)" if dry_run else ""))
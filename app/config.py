@@ -17,3 +17,27 @@ class Config:
 
     SQLALCHEMY_DATABASE_URI = _db_url
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Seconds an authenticated user / admin buildings stay cached per process (0 = off)
+    PRINCIPAL_CACHE_TTL = float(os.environ.get("PRINCIPAL_CACHE_TTL", "30"))
+
+    # Embed allowed buildings in JWTs and trust them on read-only endpoints
+    # while the token version still matches ("1" = on)
+    JWT_STATELESS_CLAIMS = os.environ.get("JWT_STATELESS_CLAIMS", "0") == "1"
+
+    # werkzeug hash method for new/rehashed passwords, e.g. "scrypt:16384:8:1"
+    # or "pbkdf2:sha256:600000" (empty = werkzeug default, no rehashing). When
+    # set, older hashes are upgraded transparently on the next successful login.
+    PASSWORD_HASH_METHOD = os.environ.get("PASSWORD_HASH_METHOD", "")
+
+    # >0: verify passwords in a bounded thread pool of this size (gthread workers)
+    PASSWORD_VERIFY_WORKERS = int(os.environ.get("PASSWORD_VERIFY_WORKERS", "0"))
+
+    # building/floor/apartment → resident lookup cache (app.unit_lookup)
+    UNIT_CACHE_SIZE = int(os.environ.get("UNIT_CACHE_SIZE", "4096"))
+    UNIT_CACHE_TTL = float(os.environ.get("UNIT_CACHE_TTL", "300"))
+
+    # public units-status responses per (building, year, month), per process
+    # (app.units_status_cache); the TTL bounds staleness across workers
+    UNITS_STATUS_CACHE_SIZE = int(os.environ.get("UNITS_STATUS_CACHE_SIZE", "512"))
+    UNITS_STATUS_CACHE_TTL = float(os.environ.get("UNITS_STATUS_CACHE_TTL", "30"))
@@ -1,54 +1,279 @@
 import json
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 import google.auth
 from google.oauth2 import service_account
 from google.auth.transport.requests import Request
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ConnectTimeoutError
 import os
 
+logger = logging.getLogger(__name__)
+
 # Path to your service account file
 SERVICE_ACCOUNT_FILE = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
 
-# FCM v1 endpoint
-FCM_ENDPOINT = (
-    "https://fcm.googleapis.com/v1/projects/{project_id}/messages:send"
+# FCM v1 endpoint (overridable, e.g. to point at a local fake FCM server)
+FCM_ENDPOINT = os.getenv(
+    "FCM_ENDPOINT",
+    "https://fcm.googleapis.com/v1/projects/{project_id}/messages:send",
 )
 
+# How many pushes are in flight at once when sending to many users
+FCM_MAX_WORKERS = int(os.getenv("FCM_MAX_WORKERS", "8"))
+FCM_TIMEOUT = float(os.getenv("FCM_TIMEOUT", "10"))
+FCM_MAX_RETRIES = int(os.getenv("FCM_MAX_RETRIES", "3"))
+# Upper bound for one retry wait, including a server-sent Retry-After
+FCM_MAX_BACKOFF = float(os.getenv("FCM_MAX_BACKOFF", "5"))
 
-def get_access_token():
+SCOPES = ["https://www.googleapis.com/auth/firebase.messaging"]
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def _failed_before_sending(exc: requests.RequestException) -> bool:
     """
-    Generates an OAuth2 access token using the service account key.
+    True when the connection itself couldn't be made (DNS, refused, connect
+    timeout), so FCM never saw the message. Read timeouts / dropped
+    connections are not: FCM may already have accepted it.
     """
-    scopes = ["https://www.googleapis.com/auth/firebase.messaging"]
-    credentials = service_account.Credentials.from_service_account_file(
-        SERVICE_ACCOUNT_FILE, scopes=scopes
-    )
-    credentials.refresh(Request())
-    return credentials.token
+    if isinstance(exc, requests.exceptions.ConnectTimeout):
+        return True
+    if isinstance(exc, requests.ConnectionError) and exc.args:
+        # urllib3 MaxRetryError → .reason NewConnectionError / NameResolutionError (ConnectTimeoutError subclasses)
+        return isinstance(getattr(exc.args[0], "reason", None), ConnectTimeoutError)
+    return False
 
 
-def send_push_v1(project_id: str, token: str, title: str, body: str):
+class FcmClient:
     """
-    Sends a push notification using FCM HTTP v1 API.
+    One per process: holds the service-account credentials (renewed before
+    they expire), a keep-alive session and simple send metrics.
+    Thread-safe, so it can be shared by a thread pool.
     """
 
-    access_token = get_access_token()
+    def __init__(
+        self,
+        project_id: str = None,
+        service_account_file: str = None,
+        endpoint: str = FCM_ENDPOINT,
+        pool_size: int = FCM_MAX_WORKERS,
+        timeout: float = FCM_TIMEOUT,
+        max_retries: int = FCM_MAX_RETRIES,
+        backoff_sec: float = 0.5,
+        max_backoff: float = FCM_MAX_BACKOFF,
+        renew_before: timedelta = timedelta(minutes=5),
+    ):
+        self.project_id = project_id or os.getenv("FIREBASE_PROJECT_ID")
+        self.service_account_file = service_account_file or SERVICE_ACCOUNT_FILE
+        self.endpoint = endpoint
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_sec = backoff_sec
+        self.max_backoff = max_backoff
+        self.renew_before = renew_before
+
+        self._credentials = None
+        self._credentials_lock = threading.Lock()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._metrics_lock = threading.Lock()
+        self._metrics = {
+            "calls": 0,
+            "success": 0,
+            "failed": 0,
+            "retries": 0,
+            "total_latency_ms": 0.0,
+            "max_latency_ms": 0.0,
+        }
+
+    def get_access_token(self) -> str:
+        """
+        Returns a valid OAuth2 access token, refreshing it shortly before expiry.
+        """
+        with self._credentials_lock:
+            if self._credentials is None:
+                self._credentials = service_account.Credentials.from_service_account_file(
+                    self.service_account_file, scopes=SCOPES
+                )
+
+            creds = self._credentials
+            expiring = (
+                creds.expiry is None
+                or creds.expiry - self.renew_before <= datetime.utcnow()
+            )
+            if not creds.token or expiring:
+                creds.refresh(Request())
+
+            return creds.token
 
-    url = FCM_ENDPOINT.format(project_id=project_id)
+    def _record(self, ok: bool, latency_ms: float, retries: int):
+        with self._metrics_lock:
+            m = self._metrics
+            m["calls"] += 1
+            m["success" if ok else "failed"] += 1
+            m["retries"] += retries
+            m["total_latency_ms"] += latency_ms
+            m["max_latency_ms"] = max(m["max_latency_ms"], latency_ms)
 
-    headers = {
-        "Authorization": f"Bearer {access_token}",
-        "Content-Type": "application/json; UTF-8",
-    }
+    def metrics(self) -> dict:
+        with self._metrics_lock:
+            m = dict(self._metrics)
+        m["avg_latency_ms"] = round(m["total_latency_ms"] / m["calls"], 2) if m["calls"] else 0.0
+        return m
 
-    payload = {
-        "message": {
-            "token": token,
-            "notification": {"title": title, "body": body},
-            "webpush": {
-                "fcm_options": {"link": "https://airnav-compound.work.gd/"}
-            },
+    def _retry_delay(self, response, attempt: int) -> float:
+        """
+        Seconds to wait before the next attempt: Retry-After when FCM sends one,
+        else exponential backoff with jitter; capped at max_backoff so a send
+        never holds a worker / pool thread for long.
+        """
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after:
+            try:
+                return min(max(float(retry_after), 0.0), self.max_backoff)
+            except ValueError:
+                pass
+        delay = self.backoff_sec * (2 ** attempt) + random.uniform(0, self.backoff_sec)
+        return min(delay, self.max_backoff)
+
+    def send(self, token: str, title: str, body: str, project_id: str = None):
+        """
+        Sends one notification using FCM HTTP v1 API.
+        Retries 429/5xx and connection errors before the request was sent,
+        with backoff; a read timeout is not retried (could deliver twice).
+        Returns (status_code, response_text); status_code is 0 on network failure.
+        """
+        url = self.endpoint.format(project_id=project_id or self.project_id)
+
+        payload = {
+            "message": {
+                "token": token,
+                "notification": {"title": title, "body": body},
+                "webpush": {
+                    "fcm_options": {"link": "https://airnav-compound.work.gd/"}
+                },
+            }
         }
-    }
 
-    response = requests.post(url, headers=headers, json=payload)
-    return response.status_code, response.text
+        started = time.perf_counter()
+        status_code, text = 0, ""
+
+        for attempt in range(self.max_retries + 1):
+            headers = {
+                "Authorization": f"Bearer {self.get_access_token()}",
+                "Content-Type": "application/json; UTF-8",
+            }
+
+            response = None
+            try:
+                response = self.session.post(url, headers=headers, json=payload, timeout=self.timeout)
+                status_code, text = response.status_code, response.text
+                retryable = status_code in RETRY_STATUSES
+            except requests.RequestException as exc:
+                status_code, text = 0, str(exc)
+                retryable = _failed_before_sending(exc)
+
+            if not retryable:
+                break
+            if attempt < self.max_retries:
+                time.sleep(self._retry_delay(response, attempt))
+
+        latency_ms = (time.perf_counter() - started) * 1000
+        self._record(status_code == 200, latency_ms, attempt)
+        logger.debug("FCM send status=%s latency_ms=%.1f retries=%s", status_code, latency_ms, attempt)
+
+        return status_code, text
+
+    @staticmethod
+    def is_unregistered(status_code: int, text: str) -> bool:
+        """
+        True when FCM says the token is dead (app uninstalled / token rotated).
+        """
+        if status_code == 404:
+            return True
+        if status_code == 400 and "UNREGISTERED" in (text or ""):
+            return True
+        return False
+
+    @staticmethod
+    def is_token_error(status_code: int, text: str) -> bool:
+        """
+        True when FCM rejects this token itself (malformed, or registered to
+        another sender), as opposed to transport / auth / quota / server errors.
+        """
+        text = text or ""
+        if status_code == 400 and "INVALID_ARGUMENT" in text:
+            return True
+        if status_code == 403 and "SENDER_ID_MISMATCH" in text:
+            return True
+        return False
+
+    def send_to_users(self, messages, max_workers: int = None, token_results: dict = None):
+        """
+        Sends one notification per user, many users at once.
+
+        messages: list of (key, tokens, title, body). For each key the tokens are
+        tried in order until one succeeds (one success per user is enough).
+        token_results: optional dict filled with { token: (status_code, text) }
+        for every token actually tried.
+
+        Returns { key: True/False }.
+        """
+
+        def _send_one(message):
+            key, tokens, title, body = message
+            for token in tokens:
+                status_code, text = self.send(token, title, body)
+                if token_results is not None:
+                    token_results[token] = (status_code, text)
+                if status_code == 200:
+                    return key, True
+            return key, False
+
+        if not messages:
+            return {}
+
+        workers = max(1, min(max_workers or self.pool_size, len(messages)))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return dict(pool.map(_send_one, messages))
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_fcm_client() -> FcmClient:
+    """
+    The process-wide FcmClient (created on first use).
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = FcmClient()
+    return _client
+
+
+def get_access_token():
+    """
+    Generates an OAuth2 access token using the service account key.
+    """
+    return get_fcm_client().get_access_token()
+
+
+def send_push_v1(project_id: str, token: str, title: str, body: str):
+    """
+    Sends a push notification using FCM HTTP v1 API.
+    """
+    return get_fcm_client().send(token, title, body, project_id=project_id)
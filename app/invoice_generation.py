@@ -0,0 +1,244 @@
+"""
+Generate maintenance invoices for many residents × many months with one
+INSERT ... SELECT, skipping (user_id, year, month) rows that already exist.
+"""
+import calendar
+import time
+from datetime import datetime
+from decimal import Decimal
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import select, insert, literal, union_all, exists, and_, true, func, Integer, Numeric, DateTime
+
+from app import db
+from app.models import User, PersonDetails, MaintenanceInvoice
+from app.month_stats import add_month_delta, record_month_deltas
+
+invoices_cli = AppGroup("invoices", help="Maintenance invoice jobs.")
+
+DEFAULT_AMOUNT = Decimal("200.00")
+DEFAULT_DUE_DAY = 5
+
+# one literal row per month in the SELECT; keep the range sane
+MAX_MONTHS = 120
+
+# maintenance_invoices.amount is Numeric(10, 2)
+MAX_AMOUNT = Decimal("99999999.99")
+
+
+def parse_period(value: str):
+    """
+    "2027-03" → (2027, 3)
+    """
+    try:
+        year, month = (int(part) for part in str(value).strip().split("-", 1))
+    except (TypeError, ValueError):
+        raise ValueError(f"invalid period {value!r}, expected YYYY-MM")
+    if not 1 <= month <= 12:
+        raise ValueError(f"invalid period {value!r}, expected YYYY-MM")
+    return year, month
+
+
+def parse_amount(value) -> Decimal:
+    """
+    "250" / 250 / Decimal → Decimal; must be a number in (0, MAX_AMOUNT].
+    """
+    try:
+        amount = Decimal(str(value).strip())
+    except ArithmeticError:
+        raise ValueError(f"invalid amount {value!r}")
+    if not amount.is_finite() or amount <= 0 or amount > MAX_AMOUNT:
+        raise ValueError(f"invalid amount {value!r}, expected 0 < amount <= {MAX_AMOUNT}")
+    return amount
+
+
+def iter_periods(start, end):
+    year, month = start
+    while (year, month) <= end:
+        yield year, month
+        month += 1
+        if month > 12:
+            month = 1
+            year += 1
+
+
+def amount_for(year: int, month: int, amount, schedule=None) -> Decimal:
+    """
+    schedule: { (year, month): amount } — each entry applies from that month on.
+    """
+    result = Decimal(str(amount))
+    for period in sorted(schedule or {}):
+        if period <= (year, month):
+            result = Decimal(str(schedule[period]))
+    return result
+
+
+def _due_date(year: int, month: int, due_day: int) -> datetime:
+    # due_day past the month's end → last day of the month
+    return datetime(year, month, min(due_day, calendar.monthrange(year, month)[1]))
+
+
+def _periods_select(periods, amount, schedule, due_day):
+    """
+    One literal row per month: (year, month, amount, due_date).
+    """
+    rows = [
+        select(
+            literal(year, Integer).label("year"),
+            literal(month, Integer).label("month"),
+            literal(amount_for(year, month, amount, schedule), Numeric(10, 2)).label("amount"),
+            literal(_due_date(year, month, due_day), DateTime).label("due_date"),
+        )
+        for year, month in periods
+    ]
+    return (union_all(*rows) if len(rows) > 1 else rows[0]).subquery("periods")
+
+
+def _missing_invoices_select(start, end, amount, schedule, due_day, user_ids, buildings):
+    periods = _periods_select(list(iter_periods(start, end)), amount, schedule, due_day)
+    now = datetime.now()
+
+    q = (
+        select(
+            User.id,
+            periods.c.year,
+            periods.c.month,
+            periods.c.amount,
+            literal("UNPAID"),
+            periods.c.due_date,
+            literal(now, DateTime),
+            literal(now, DateTime),
+        )
+        .select_from(User)
+        .join(periods, true())
+        .where(User.role == "RESIDENT")
+        .where(
+            ~exists().where(
+                and_(
+                    MaintenanceInvoice.user_id == User.id,
+                    MaintenanceInvoice.year == periods.c.year,
+                    MaintenanceInvoice.month == periods.c.month,
+                )
+            )
+        )
+    )
+    if user_ids is not None:
+        q = q.where(User.id.in_(list(user_ids)))
+    if buildings:
+        q = q.join(PersonDetails, PersonDetails.user_id == User.id).where(PersonDetails.building.in_(list(buildings)))
+    return q
+
+
+def _count_by_building(q):
+    """
+    (building, year, month, invoices) for the rows q would insert.
+    """
+    rows = q.subquery()
+    return (
+        select(PersonDetails.building, rows.c.year, rows.c.month, func.count())
+        .select_from(rows)
+        .join(PersonDetails, PersonDetails.user_id == rows.c.id)
+        .group_by(PersonDetails.building, rows.c.year, rows.c.month)
+    )
+
+
+def generate_invoices(
+    start,
+    end,
+    amount=DEFAULT_AMOUNT,
+    due_day: int = DEFAULT_DUE_DAY,
+    schedule=None,
+    user_ids=None,
+    buildings=None,
+    dry_run: bool = False,
+):
+    """
+    Create UNPAID invoices for every RESIDENT (or only user_ids / residents of
+    `buildings`) for each month in [start, end], skipping existing months.
+    start / end: (year, month). Caller commits.
+
+    Returns { inserted, months, elapsed_ms } ("inserted" = would insert when dry_run).
+    """
+    if end < start:
+        raise ValueError("end period is before start period")
+    amount = parse_amount(amount)
+    schedule = {period: parse_amount(value) for period, value in (schedule or {}).items()}
+    if not 1 <= int(due_day) <= 31:
+        raise ValueError("due_day must be between 1 and 31")
+    if sum(1 for _ in iter_periods(start, end)) > MAX_MONTHS:
+        raise ValueError(f"period range is longer than {MAX_MONTHS} months")
+
+    started = time.perf_counter()
+    q = _missing_invoices_select(start, end, amount, schedule, int(due_day), user_ids, buildings)
+
+    if dry_run:
+        inserted = db.session.execute(select(func.count()).select_from(q.subquery())).scalar()
+    else:
+        # counted before the insert: INSERT ... SELECT bypasses the ORM month-stats hooks
+        deltas = {}
+        for building, year, month, count in db.session.execute(_count_by_building(q)):
+            add_month_delta(deltas, (building, year, month), unit_count=count)
+
+        result = db.session.execute(
+            insert(MaintenanceInvoice).from_select(
+                ["user_id", "year", "month", "amount", "status", "due_date", "created_at", "updated_at"],
+                q,
+            )
+        )
+        inserted = result.rowcount
+        record_month_deltas(deltas)
+
+    return {
+        "inserted": inserted,
+        "months": sum(1 for _ in iter_periods(start, end)),
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+
+
+def parse_schedule(items):
+    """
+    ["2027-07=250", ...] or { "2027-07": 250 } → { (2027, 7): Decimal("250") }
+    """
+    pairs = items.items() if isinstance(items, dict) else (str(i).partition("=")[::2] for i in items or [])
+    schedule = {}
+    for period, value in pairs:
+        try:
+            schedule[parse_period(period)] = parse_amount(value)
+        except ValueError as e:
+            raise ValueError(f"{e} in schedule ({period})")
+    return schedule
+
+
+@invoices_cli.command("generate")
+@click.option("--from", "start", required=True, help="First month, YYYY-MM.")
+@click.option("--to", "end", required=True, help="Last month, YYYY-MM.")
+@click.option("--amount", default=str(DEFAULT_AMOUNT), show_default=True)
+@click.option("--due-day", default=DEFAULT_DUE_DAY, show_default=True)
+@click.option("--schedule", multiple=True, help="Amount change from a month on: YYYY-MM=AMOUNT (repeatable).")
+@click.option("--building", "buildings", multiple=True, help="Only residents of this building (repeatable).")
+@click.option("--dry-run", is_flag=True, help="Only count the invoices that would be created.")
+def generate_command(start, end, amount, due_day, schedule, buildings, dry_run):
+    """Create missing invoices for all residents over a period range."""
+    try:
+        report = generate_invoices(
+            parse_period(start),
+            parse_period(end),
+            amount=parse_amount(amount),
+            due_day=due_day,
+            schedule=parse_schedule(schedule),
+            buildings=buildings or None,
+            dry_run=dry_run,
+        )
+    except (ValueError, ArithmeticError) as e:
+        raise click.BadParameter(str(e))
+
+    if dry_run:
+        db.session.rollback()
+    else:
+        db.session.commit()
+
+    click.echo(
+        f"{report['inserted']} invoice(s) {'would be ' if dry_run else ''}created "
+        f"over {report['months']} month(s) in {report['elapsed_ms']} ms"
+    )
@@ -1,6 +1,19 @@
 from datetime import datetime
 from . import db
-from werkzeug.security import generate_password_hash, check_password_hash
+from .auth.passwords import hash_password, verify_password, needs_rehash
+
+
+def unit_number(value):
+    """
+    "3" / " 03 " → 3; non-numeric (or out of INTEGER range) → None.
+    Shadow value of person_details.floor / apartment for numeric ordering.
+    """
+    value = (value or "").strip()
+    if not value.isdigit() or not value.isascii():
+        return None
+    number = int(value)
+    return number if number < 2 ** 31 else None
+
 
 class User(db.Model):
     __tablename__ = "users"
@@ -15,17 +28,29 @@ class User(db.Model):
 
     last_login_at = db.Column(db.DateTime, nullable=True)
 
+    # bumped whenever role / password / admin buildings change → stale JWT claims
+    token_version = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+
     def set_password(self, password: str):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)
 
     def check_password(self, password: str) -> bool:
-        return check_password_hash(self.password_hash, password)
+        return verify_password(self.password_hash, password)
+
+    def password_needs_rehash(self) -> bool:
+        return needs_rehash(self.password_hash)
 
     def __repr__(self):
         return f"<User {self.username} ({self.role})>"
 
 class PersonDetails(db.Model):
     __tablename__ = "person_details"
+    __table_args__ = (
+        # unit lookups: login, create-user checks, residents search
+        db.Index("ix_person_details_building_floor_apartment", "building", "floor", "apartment"),
+        # units-status listings, presorted by floor / apartment number
+        db.Index("ix_person_details_building_floor_num_apartment_num", "building", "floor_num", "apartment_num"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     full_name = db.Column(db.String(120), nullable=False)
@@ -33,6 +58,10 @@ class PersonDetails(db.Model):
     floor = db.Column(db.String(10), nullable=False)
     apartment = db.Column(db.String(10), nullable=False)
 
+    # numeric floor / apartment (None when not a number), kept in sync by _sync_unit_numbers
+    floor_num = db.Column(db.Integer, nullable=True)
+    apartment_num = db.Column(db.Integer, nullable=True)
+
     # one-to-one with users table
     user_id = db.Column(
         db.Integer,
@@ -48,22 +77,48 @@ class PersonDetails(db.Model):
         backref=db.backref("person_details", uselist=False),
     )
 
+    @db.validates("floor", "apartment")
+    def _sync_unit_numbers(self, key, value):
+        setattr(self, f"{key}_num", unit_number(value))
+        return value
+
     def __repr__(self):
         return f"<PersonDetails {self.full_name} (B{self.building}/F{self.floor}/A{self.apartment})>"
 
 class MaintenanceInvoice(db.Model):
     __tablename__ = "maintenance_invoices"
+    __table_args__ = (
+        # only the (small) set of not-yet-paid invoices, used by late-residents
+        db.Index(
+            "ix_maintenance_invoices_status_unpaid",
+            "status",
+            postgresql_where=db.text("status <> 'PAID'"),
+            sqlite_where=db.text("status <> 'PAID'"),
+        ),
+        # one invoice per resident per month; also serves user_id lookups
+        db.Index("ix_maintenance_invoices_user_year_month", "user_id", "year", "month", unique=True),
+        # month-level stats / rankings / units-status joins
+        db.Index("ix_maintenance_invoices_year_month_status", "year", "month", "status"),
+        # PAID invoices collected for less than their amount, used by late-residents
+        db.Index(
+            "ix_maintenance_invoices_paid_short",
+            "user_id",
+            postgresql_where=db.text("status = 'PAID' AND collected_amount < amount"),
+            sqlite_where=db.text("status = 'PAID' AND collected_amount < amount"),
+        ),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(
         db.Integer,
         db.ForeignKey("users.id"),
         nullable=False,
-        index=True,
     )
     year = db.Column(db.Integer, nullable=False)
     month = db.Column(db.Integer, nullable=False)  # 1–12
     amount = db.Column(db.Numeric(10, 2), nullable=False)
+    # sum of this invoice's payments (kept by app.cash_balances.record_invoice_collected)
+    collected_amount = db.Column(db.Numeric(10, 2), nullable=False, default=0, server_default="0")
     status = db.Column(db.String(20), nullable=False, default="UNPAID")
     due_date = db.Column(db.DateTime, nullable=False)
     paid_date = db.Column(db.DateTime, nullable=True)
@@ -184,6 +239,18 @@ class UnionLedgerEntry(db.Model):
 
     created_by = db.relationship("User", backref="ledger_entries")
 
+class UnionBalance(db.Model):
+    """
+    Single-row head of the union ledger: current balance + last entry.
+    Appends lock this row, so concurrent workers can't fork the running balance.
+    """
+    __tablename__ = "union_balance"
+
+    id = db.Column(db.Integer, primary_key=True)  # always 1
+    balance = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+    last_entry_id = db.Column(db.Integer, db.ForeignKey("union_ledger.id"), nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+
 class Expense(db.Model):
     __tablename__ = "expenses"
 
@@ -200,7 +267,7 @@ class NotificationSubscription(db.Model):
     __tablename__ = "notification_subscriptions"
 
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False, index=True)
     token = db.Column(db.String(512), nullable=False, unique=True)
     user_agent = db.Column(db.String(256))
     created_at = db.Column(db.DateTime, default=datetime.now())
@@ -208,6 +275,11 @@ class NotificationSubscription(db.Model):
         db.DateTime, default=datetime.now(), onupdate=datetime.now()
     )
 
+    # delivery outcome tracking (dead tokens get pruned)
+    last_success_at = db.Column(db.DateTime, nullable=True)
+    last_failure_at = db.Column(db.DateTime, nullable=True)
+    failure_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+
     user = db.relationship("User", backref="notification_subscriptions")
 
 class OnlinePayment(db.Model):
@@ -305,3 +377,75 @@ class Income(db.Model):
 
     created_by_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
     created_by = db.relationship("User", backref="incomes")
+
+class AdminCashBalance(db.Model):
+    """
+    Running cash totals per collector (admin), maintained on every
+    payment / settlement so summaries don't re-aggregate the history.
+    """
+    __tablename__ = "admin_cash_balances"
+
+    admin_id = db.Column(db.Integer, db.ForeignKey("users.id"), primary_key=True)
+
+    collected_amount = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+    settled_amount = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+    payments_count = db.Column(db.Integer, nullable=False, default=0)
+
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+
+    admin = db.relationship(
+        "User",
+        backref=db.backref("cash_balance", uselist=False),
+    )
+
+    def __repr__(self):
+        return f"<AdminCashBalance admin={self.admin_id} collected={self.collected_amount} settled={self.settled_amount}>"
+
+
+class BuildingMonthStats(db.Model):
+    """
+    Per building and month: invoices issued (unit_count) and how many / how
+    much of them are PAID, for residents currently in that building.
+    Maintained from invoice changes (app.month_stats) so ranking reports
+    don't aggregate the whole invoice history.
+    """
+    __tablename__ = "building_month_stats"
+
+    building = db.Column(db.String(10), primary_key=True)
+    year = db.Column(db.Integer, primary_key=True)
+    month = db.Column(db.Integer, primary_key=True)
+
+    unit_count = db.Column(db.Integer, nullable=False, default=0)
+    paid_count = db.Column(db.Integer, nullable=False, default=0)
+    paid_amount = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+
+    def __repr__(self):
+        return f"<BuildingMonthStats B{self.building} {self.year}-{self.month}: {self.paid_count}/{self.unit_count}>"
+
+
+class Unit(db.Model):
+    """
+    Registry of apartments: one row per building / floor / apartment, with
+    whether a resident lives there and its monthly maintenance fee.
+    Kept in sync with person_details (app.unit_registry).
+    """
+    __tablename__ = "units"
+    __table_args__ = (
+        db.UniqueConstraint("building", "floor", "apartment", name="uq_units_building_floor_apartment"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    building = db.Column(db.String(10), nullable=False, index=True)
+    floor = db.Column(db.String(10), nullable=False)
+    apartment = db.Column(db.String(10), nullable=False)
+
+    occupied = db.Column(db.Boolean, nullable=False, default=False)
+    monthly_fee = db.Column(db.Numeric(10, 2), nullable=False, default=200)
+
+    created_at = db.Column(db.DateTime, default=datetime.now)
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+
+    def __repr__(self):
+        return f"<Unit B{self.building}/F{self.floor}/A{self.apartment} occupied={self.occupied}>"
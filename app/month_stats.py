@@ -0,0 +1,408 @@
+"""
+building_month_stats: per building / month rollup of invoices issued
+(unit_count) and PAID invoices (paid_count, paid_amount), read by the
+treasurer ranking reports.
+
+Kept current in the same transaction as the change:
+- ORM changes to invoices (create / status / amount / delete) become deltas,
+  collected at each flush and applied right before commit;
+- a resident moving building, gaining / losing the RESIDENT role or being
+  deleted moves their invoice totals per month from the old building to the
+  new one (new residents need nothing: their invoices arrive as deltas);
+- set-wise writers (bulk collect, invoice generation) call
+  record_month_deltas themselves.
+
+`flask month-stats rebuild` recomputes the rollup from invoices (backfill /
+drift check); it is never run on a request path.
+"""
+from decimal import Decimal
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import event, func, inspect, case, tuple_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models import User, PersonDetails, MaintenanceInvoice, BuildingMonthStats
+
+month_stats_cli = AppGroup("month-stats", help="Maintain building_month_stats.")
+
+# invoice attributes the rollup depends on
+INVOICE_FIELDS = ("user_id", "year", "month", "status", "amount")
+
+
+def _to_decimal(value) -> Decimal:
+    return Decimal(str(value or 0))
+
+
+def add_month_delta(deltas: dict, key, unit_count: int = 0, paid_count: int = 0, paid_amount=0):
+    """
+    Accumulate into deltas[(building, year, month)] for record_month_deltas.
+    """
+    delta = deltas.setdefault(key, [0, 0, Decimal("0")])
+    delta[0] += unit_count
+    delta[1] += paid_count
+    delta[2] += _to_decimal(paid_amount)
+
+
+def _apply_delta(building: str, year: int, month: int, unit_count: int, paid_count: int, paid_amount: Decimal):
+    """
+    Atomic UPDATE ... SET x = x + delta on the row, creating it if missing
+    (same approach as cash_balances._apply_delta).
+    """
+    values = {
+        BuildingMonthStats.unit_count: BuildingMonthStats.unit_count + unit_count,
+        BuildingMonthStats.paid_count: BuildingMonthStats.paid_count + paid_count,
+        BuildingMonthStats.paid_amount: BuildingMonthStats.paid_amount + paid_amount,
+    }
+    criteria = (
+        BuildingMonthStats.building == building,
+        BuildingMonthStats.year == year,
+        BuildingMonthStats.month == month,
+    )
+
+    updated = db.session.query(BuildingMonthStats).filter(*criteria).update(values, synchronize_session=False)
+    if updated:
+        return
+
+    try:
+        with db.session.begin_nested():
+            db.session.add(
+                BuildingMonthStats(
+                    building=building,
+                    year=year,
+                    month=month,
+                    unit_count=unit_count,
+                    paid_count=paid_count,
+                    paid_amount=paid_amount,
+                )
+            )
+    except IntegrityError:
+        # created concurrently → add on top of it
+        db.session.query(BuildingMonthStats).filter(*criteria).update(values, synchronize_session=False)
+
+
+def record_month_deltas(deltas: dict):
+    """
+    deltas: { (building, year, month): [unit_count, paid_count, paid_amount] }
+    Applied in the current transaction (caller commits).
+    """
+    for (building, year, month), (unit_count, paid_count, paid_amount) in sorted(deltas.items()):
+        if unit_count or paid_count or paid_amount:
+            _apply_delta(building, year, month, unit_count, paid_count, _to_decimal(paid_amount))
+
+
+def _resident_buildings(user_ids):
+    """
+    { user_id: building } for RESIDENT users among user_ids.
+    """
+    if not user_ids:
+        return {}
+    rows = (
+        db.session.query(PersonDetails.user_id, PersonDetails.building)
+        .join(User, User.id == PersonDetails.user_id)
+        .filter(User.role == "RESIDENT", PersonDetails.user_id.in_(list(user_ids)))
+        .all()
+    )
+    return {r.user_id: r.building for r in rows}
+
+
+def _expected_stats(buildings=None, periods=None):
+    """
+    { (building, year, month): (unit_count, paid_count, paid_amount) } from invoices.
+    """
+    is_paid = MaintenanceInvoice.status == "PAID"
+    q = (
+        db.session.query(
+            PersonDetails.building,
+            MaintenanceInvoice.year,
+            MaintenanceInvoice.month,
+            func.count(MaintenanceInvoice.id),
+            func.sum(case((is_paid, 1), else_=0)),
+            func.coalesce(func.sum(case((is_paid, MaintenanceInvoice.amount), else_=0)), 0),
+        )
+        .join(User, User.id == MaintenanceInvoice.user_id)
+        .join(PersonDetails, PersonDetails.user_id == User.id)
+        .filter(User.role == "RESIDENT")
+        .group_by(PersonDetails.building, MaintenanceInvoice.year, MaintenanceInvoice.month)
+    )
+    if buildings is not None:
+        q = q.filter(PersonDetails.building.in_(list(buildings)))
+    if periods is not None:
+        q = q.filter(tuple_(MaintenanceInvoice.year, MaintenanceInvoice.month).in_(list(periods)))
+
+    return {
+        (building, year, month): (int(units), int(paid or 0), _to_decimal(amount))
+        for building, year, month, units, paid, amount in q.all()
+    }
+
+
+def rebuild_month_stats(buildings=None, periods=None, apply: bool = True):
+    """
+    Recompute rows for `buildings` / `periods` [(year, month)] (None = all)
+    from invoices and compare with the table. Returns the drifted rows; when
+    apply=True the table is corrected (caller commits).
+    """
+    if (buildings is not None and not buildings) or (periods is not None and not periods):
+        return []
+
+    expected = _expected_stats(buildings, periods)
+
+    q = BuildingMonthStats.query.with_for_update()
+    if buildings is not None:
+        q = q.filter(BuildingMonthStats.building.in_(list(buildings)))
+    if periods is not None:
+        q = q.filter(tuple_(BuildingMonthStats.year, BuildingMonthStats.month).in_(list(periods)))
+    current = {(s.building, s.year, s.month): s for s in q.all()}
+
+    drift = []
+    for key in sorted(set(expected) | set(current)):
+        want = expected.get(key)
+        row = current.get(key)
+        have = (row.unit_count, row.paid_count, _to_decimal(row.paid_amount)) if row else None
+
+        if have == want or (want is None and have == (0, 0, Decimal("0"))):
+            continue
+
+        zero = (0, 0, Decimal("0"))
+        drift.append({
+            "building": key[0],
+            "year": key[1],
+            "month": key[2],
+            "unit_count": [(have or zero)[0], (want or zero)[0]],
+            "paid_count": [(have or zero)[1], (want or zero)[1]],
+            "paid_amount": [float((have or zero)[2]), float((want or zero)[2])],
+        })
+
+        if not apply:
+            continue
+
+        if want is None:
+            db.session.delete(row)
+            continue
+        if row is None:
+            row = BuildingMonthStats(building=key[0], year=key[1], month=key[2])
+            db.session.add(row)
+        row.unit_count, row.paid_count, row.paid_amount = want
+
+    return drift
+
+
+def get_month_stats(year=None, month=None):
+    """
+    { building: {unit_count, paid_count, paid_amount, months} } summed over
+    the matching months (year / month None = any); months = how many of them
+    had invoices issued.
+    """
+    q = db.session.query(
+        BuildingMonthStats.building,
+        func.sum(BuildingMonthStats.unit_count),
+        func.sum(BuildingMonthStats.paid_count),
+        func.sum(BuildingMonthStats.paid_amount),
+        func.sum(case((BuildingMonthStats.unit_count > 0, 1), else_=0)),
+    ).group_by(BuildingMonthStats.building)
+    if year is not None:
+        q = q.filter(BuildingMonthStats.year == year)
+    if month is not None:
+        q = q.filter(BuildingMonthStats.month == month)
+
+    return {
+        building: {
+            "unit_count": int(units or 0),
+            "paid_count": int(paid or 0),
+            "paid_amount": _to_decimal(amount),
+            "months": int(months or 0),
+        }
+        for building, units, paid, amount, months in q.all()
+    }
+
+
+# ---- ORM changes: collect at flush, apply right before commit ----
+
+def _contribution(obj, current: bool):
+    """
+    (user_id, year, month, is_paid, amount) of an invoice before (current=False)
+    or after (current=True) this flush.
+    """
+    state = inspect(obj)
+    values = []
+    for field in INVOICE_FIELDS:
+        history = state.attrs[field].history
+        values_known = history.added if current else history.deleted
+        if values_known:
+            values.append(values_known[0])
+        elif history.unchanged:
+            values.append(history.unchanged[0])
+        else:
+            # not loaded and not changed: same before and after, read it from the row
+            values.append(getattr(obj, field))
+    user_id, year, month, status, amount = values
+    return user_id, year, month, status == "PAID", amount
+
+
+def _pending(session):
+    return session.info.setdefault("month_stats_pending", {"invoices": [], "origins": {}})
+
+
+def _note_origin(session, pending, user_id):
+    """
+    Remember the building the user's invoices were counted under when the
+    transaction started (None = not a resident, counted nowhere).
+    """
+    if user_id is None or user_id in pending["origins"]:
+        return
+    # first change seen for this user: the row still holds the original values
+    with session.no_autoflush:
+        pending["origins"][user_id] = (
+            session.query(PersonDetails.building)
+            .join(User, User.id == PersonDetails.user_id)
+            .filter(User.role == "RESIDENT", PersonDetails.user_id == user_id)
+            .scalar()
+        )
+
+
+def _user_month_totals(user_ids):
+    """
+    { user_id: [(year, month, unit_count, paid_count, paid_amount)] } from invoices.
+    """
+    is_paid = MaintenanceInvoice.status == "PAID"
+    rows = (
+        db.session.query(
+            MaintenanceInvoice.user_id,
+            MaintenanceInvoice.year,
+            MaintenanceInvoice.month,
+            func.count(MaintenanceInvoice.id),
+            func.sum(case((is_paid, 1), else_=0)),
+            func.coalesce(func.sum(case((is_paid, MaintenanceInvoice.amount), else_=0)), 0),
+        )
+        .filter(MaintenanceInvoice.user_id.in_(list(user_ids)))
+        .group_by(MaintenanceInvoice.user_id, MaintenanceInvoice.year, MaintenanceInvoice.month)
+        .all()
+    )
+    totals = {}
+    for user_id, year, month, units, paid, amount in rows:
+        totals.setdefault(user_id, []).append((year, month, int(units), int(paid or 0), _to_decimal(amount)))
+    return totals
+
+
+@event.listens_for(Session, "before_flush")
+def _collect_month_stats_changes(session, flush_context, instances):
+    pending = None
+
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, MaintenanceInvoice):
+            state = inspect(obj)
+            is_new = obj in session.new
+            is_deleted = obj in session.deleted
+            if not (is_new or is_deleted or any(state.attrs[f].history.has_changes() for f in INVOICE_FIELDS)):
+                continue
+            pending = pending or _pending(session)
+            pending["invoices"].append((
+                None if is_new else _contribution(obj, current=False),
+                None if is_deleted else _contribution(obj, current=True),
+            ))
+
+        elif isinstance(obj, PersonDetails):
+            # a new resident has no counted invoices yet
+            if obj in session.new:
+                continue
+            state = inspect(obj)
+            if obj in session.dirty and not (
+                state.attrs.building.history.has_changes() or state.attrs.user_id.history.has_changes()
+            ):
+                continue
+            pending = pending or _pending(session)
+            for user_id in set(state.attrs.user_id.history.sum()) | {obj.user_id}:
+                _note_origin(session, pending, user_id)
+
+        elif isinstance(obj, User) and obj not in session.new and (
+            obj in session.deleted or inspect(obj).attrs.role.history.has_changes()
+        ):
+            pending = pending or _pending(session)
+            _note_origin(session, pending, obj.id)
+
+
+@event.listens_for(Session, "before_commit")
+def _apply_month_stats_changes(session):
+    if session.in_nested_transaction():
+        return
+    session.flush()
+    pending = session.info.pop("month_stats_pending", None)
+    if not pending:
+        return
+
+    origins = pending["origins"]
+    buildings_by_user = _resident_buildings(
+        {c[0] for change in pending["invoices"] for c in change if c is not None} | set(origins)
+    )
+
+    deltas = {}
+    for before, after in pending["invoices"]:
+        for contribution, sign in ((before, -1), (after, 1)):
+            if contribution is None:
+                continue
+            user_id, year, month, is_paid, amount = contribution
+            # a moved resident's invoice changes apply where their totals were counted;
+            # their current totals are moved as a whole below
+            building = origins[user_id] if user_id in origins else buildings_by_user.get(user_id)
+            if building is None:
+                continue
+            add_month_delta(
+                deltas,
+                (building, year, month),
+                unit_count=sign,
+                paid_count=sign if is_paid else 0,
+                paid_amount=sign * _to_decimal(amount) if is_paid else 0,
+            )
+
+    moved = {user_id for user_id, origin in origins.items() if origin != buildings_by_user.get(user_id)}
+    if moved:
+        for user_id, months in _user_month_totals(moved).items():
+            for building, sign in ((origins[user_id], -1), (buildings_by_user.get(user_id), 1)):
+                if building is None:
+                    continue
+                for year, month, units, paid, amount in months:
+                    add_month_delta(
+                        deltas,
+                        (building, year, month),
+                        unit_count=sign * units,
+                        paid_count=sign * paid,
+                        paid_amount=sign * amount,
+                    )
+
+    record_month_deltas(deltas)
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _discard_month_stats_changes(session, transaction):
+    # outermost transaction only: a rolled back savepoint doesn't undo earlier flushes
+    if transaction.parent is None:
+        session.info.pop("month_stats_pending", None)
+
+
+# old values of these are needed for the deltas even when they weren't loaded before being set
+for _field in INVOICE_FIELDS:
+    event.listen(getattr(MaintenanceInvoice, _field), "set", lambda *args: None, active_history=True)
+
+
+@month_stats_cli.command("rebuild")
+@click.option("--building", "buildings", multiple=True, help="Only this building (repeatable).")
+@click.option("--dry-run", is_flag=True, help="Only report drift, don't fix it.")
+def rebuild_command(buildings, dry_run: bool):
+    """Backfill / recompute building_month_stats from invoices and report drift."""
+    drift = rebuild_month_stats(buildings=list(buildings) or None, apply=not dry_run)
+
+    if dry_run:
+        db.session.rollback()
+    else:
+        db.session.commit()
+
+    for d in drift:
+        click.echo(
+            f"building {d['building']} {d['year']}-{d['month']:02d}: "
+            f"units {d['unit_count'][0]} -> {d['unit_count'][1]}, "
+            f"paid {d['paid_count'][0]} -> {d['paid_count'][1]}, "
+            f"amount {d['paid_amount'][0]:.2f} -> {d['paid_amount'][1]:.2f}"
+        )
+    click.echo(f"{len(drift)} building month(s) drifted" + (" (not fixed, dry run)" if dry_run else ""))
@@ -2,7 +2,8 @@ from flask import Blueprint, request, jsonify
 from app import db
 from app.models import NotificationSubscription
 from .auth.routes import get_current_user_from_request
-from .fcm import send_push_v1
+from .fcm import get_fcm_client
+from .push_subscriptions import live_subscriptions_query, record_push_results
 import os
 
 notifications_bp = Blueprint("notifications", __name__)
@@ -27,6 +28,7 @@ def register_notification():
     if sub:
         sub.user_id = current_user.id
         sub.user_agent = user_agent
+        sub.failure_count = 0
     else:
         sub = NotificationSubscription(
             user_id=current_user.id,
@@ -48,9 +50,8 @@ def send_test_notification():
         return jsonify({"message": msg}), status
 
     sub = (
-        NotificationSubscription.query
+        live_subscriptions_query()
         .filter_by(user_id=current_user.id)
-        .order_by(NotificationSubscription.updated_at.desc())
         .first()
     )
 
@@ -59,13 +60,16 @@ def send_test_notification():
 
     project_id = os.getenv("FIREBASE_PROJECT_ID")
 
-    status_code, message = send_push_v1(
-        project_id,
+    status_code, message = get_fcm_client().send(
         sub.token,
         "📢 إشعار تجريبي",
-        "هذه تجربة من إشعارات اتحاد الشاغلين 👌"
+        "هذه تجربة من إشعارات اتحاد الشاغلين 👌",
+        project_id=project_id,
     )
 
+    record_push_results({sub.token: (status_code, message)})
+    db.session.commit()
+
     return jsonify({"status": status_code, "response": message}), (
         200 if status_code == 200 else 500
     )
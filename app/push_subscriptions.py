@@ -0,0 +1,124 @@
+from datetime import datetime, timedelta
+import os
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import and_, or_
+
+from app import db
+from app.models import NotificationSubscription
+from app.fcm import FcmClient
+
+push_subscriptions_cli = AppGroup("push-subscriptions", help="Maintain notification_subscriptions.")
+
+# After this many consecutive token errors a token is no longer used / gets pruned
+MAX_PUSH_FAILURES = int(os.getenv("MAX_PUSH_FAILURES", "5"))
+
+
+def live_subscriptions_query():
+    """
+    Subscriptions worth sending to, most reliable first.
+    """
+    return (
+        NotificationSubscription.query
+        .filter(NotificationSubscription.failure_count < MAX_PUSH_FAILURES)
+        .order_by(
+            NotificationSubscription.failure_count.asc(),
+            NotificationSubscription.updated_at.desc(),
+        )
+    )
+
+
+def record_push_results(token_results: dict):
+    """
+    Feed send outcomes back into notification_subscriptions (caller commits):
+    - 200           → last_success_at = now, failure_count = 0
+    - UNREGISTERED  → row deleted
+    - token errors (INVALID_ARGUMENT / SENDER_ID_MISMATCH)
+                    → failure_count + 1, last_failure_at = now
+    - anything else (network, 401/403, 429, 5xx: not the token's fault)
+                    → last_failure_at = now only
+
+    token_results: { token: (status_code, response_text) }
+    """
+    now = datetime.now()
+    ok, dead, failed, transient = [], [], [], []
+
+    for token, (status_code, text) in token_results.items():
+        if status_code == 200:
+            ok.append(token)
+        elif FcmClient.is_unregistered(status_code, text):
+            dead.append(token)
+        elif FcmClient.is_token_error(status_code, text):
+            failed.append(token)
+        else:
+            transient.append(token)
+
+    if ok:
+        NotificationSubscription.query.filter(NotificationSubscription.token.in_(ok)).update(
+            {
+                NotificationSubscription.last_success_at: now,
+                NotificationSubscription.failure_count: 0,
+            },
+            synchronize_session=False,
+        )
+
+    if failed:
+        NotificationSubscription.query.filter(NotificationSubscription.token.in_(failed)).update(
+            {
+                NotificationSubscription.last_failure_at: now,
+                NotificationSubscription.failure_count: NotificationSubscription.failure_count + 1,
+            },
+            synchronize_session=False,
+        )
+
+    if transient:
+        NotificationSubscription.query.filter(NotificationSubscription.token.in_(transient)).update(
+            {NotificationSubscription.last_failure_at: now},
+            synchronize_session=False,
+        )
+
+    if dead:
+        NotificationSubscription.query.filter(NotificationSubscription.token.in_(dead)).delete(
+            synchronize_session=False
+        )
+
+    return {"ok": len(ok), "failed": len(failed), "transient": len(transient), "removed": len(dead)}
+
+
+def prune_stale_subscriptions(max_failures: int = MAX_PUSH_FAILURES, inactive_days: int = 90):
+    """
+    Delete tokens that keep failing, or that failed and haven't delivered
+    anything for `inactive_days`. Returns the number of rows deleted (caller commits).
+    """
+    cutoff = datetime.now() - timedelta(days=inactive_days)
+
+    return (
+        NotificationSubscription.query
+        .filter(
+            or_(
+                NotificationSubscription.failure_count >= max_failures,
+                and_(
+                    NotificationSubscription.failure_count > 0,
+                    or_(
+                        NotificationSubscription.last_success_at < cutoff,
+                        and_(
+                            NotificationSubscription.last_success_at.is_(None),
+                            NotificationSubscription.created_at < cutoff,
+                        ),
+                    ),
+                ),
+            )
+        )
+        .delete(synchronize_session=False)
+    )
+
+
+@push_subscriptions_cli.command("prune")
+@click.option("--max-failures", default=MAX_PUSH_FAILURES, show_default=True)
+@click.option("--inactive-days", default=90, show_default=True)
+def prune_command(max_failures: int, inactive_days: int):
+    """Delete dead / stale push tokens."""
+    deleted = prune_stale_subscriptions(max_failures=max_failures, inactive_days=inactive_days)
+    db.session.commit()
+    click.echo(f"{deleted} subscription(s) removed")
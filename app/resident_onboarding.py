@@ -0,0 +1,135 @@
+"""
+Bulk resident onboarding: validate a whole list of residents up front, then
+insert users, person details and invoice schedules with a few bulk statements
+in one transaction.
+"""
+from datetime import datetime
+
+from sqlalchemy import insert, tuple_
+
+from app import db
+from app.models import User, PersonDetails, unit_number
+from app.auth.passwords import hash_passwords
+from app.invoice_generation import generate_invoices
+from app.unit_registry import sync_units
+
+MAX_BULK_USERS = 1000
+
+
+def _clean(entry: dict, key: str) -> str:
+    value = entry.get(key)
+    return value.strip() if isinstance(value, str) else ""
+
+
+def validate_residents(entries):
+    """
+    Returns (cleaned entries, errors). errors: [{ index, username, message }]
+    — same rules as superadmin_create_user for a RESIDENT, checked against the
+    DB with one query for usernames and one for units, and within the batch.
+    """
+    cleaned, errors = [], []
+
+    for index, entry in enumerate(entries):
+        if not isinstance(entry, dict):
+            errors.append({"index": index, "username": None, "message": "each resident must be an object"})
+            continue
+        item = {key: _clean(entry, key) for key in
+                ("username", "password", "full_name", "building", "floor", "apartment", "phone")}
+        item["index"] = index
+        cleaned.append(item)
+
+    def fail(item, message):
+        errors.append({"index": item["index"], "username": item["username"] or None, "message": message})
+
+    usernames = {item["username"] for item in cleaned if item["username"]}
+    units = {(item["building"], item["floor"], item["apartment"])
+             for item in cleaned if item["building"] and item["floor"] and item["apartment"]}
+
+    taken_usernames = set()
+    if usernames:
+        taken_usernames = {
+            u for (u,) in db.session.query(User.username).filter(User.username.in_(usernames)).all()
+        }
+
+    taken_units = set()
+    if units:
+        taken_units = set(
+            db.session.query(PersonDetails.building, PersonDetails.floor, PersonDetails.apartment)
+            .join(User, PersonDetails.user_id == User.id)
+            .filter(
+                User.role == "RESIDENT",
+                tuple_(PersonDetails.building, PersonDetails.floor, PersonDetails.apartment).in_(list(units)),
+            )
+            .all()
+        )
+
+    seen_usernames, seen_units = set(), set()
+    for item in cleaned:
+        unit = (item["building"], item["floor"], item["apartment"])
+
+        if not item["username"] or not item["password"]:
+            fail(item, "username and password are required")
+        elif not all(unit):
+            fail(item, "For RESIDENT users, building, floor and apartment are required and must be unique.")
+        elif item["username"] in taken_usernames or item["username"] in seen_usernames:
+            fail(item, "username already exists")
+        elif unit in taken_units or unit in seen_units:
+            fail(item, f"There is already a RESIDENT assigned to this unit (B{unit[0]} - F{unit[1]} - A{unit[2]}).")
+
+        seen_usernames.add(item["username"])
+        seen_units.add(unit)
+
+    errors.sort(key=lambda e: e["index"])
+    return cleaned, errors
+
+
+def onboard_residents(entries):
+    """
+    Create all residents or none. Returns (created users, invoices created,
+    errors); on errors nothing is written. Caller commits.
+    """
+    cleaned, errors = validate_residents(entries)
+    if errors:
+        return [], 0, errors
+
+    hashes = hash_passwords(item["password"] for item in cleaned)
+
+    created = db.session.execute(
+        insert(User).returning(User.id, User.username),
+        [
+            {"username": item["username"], "role": "RESIDENT", "password_hash": password_hash}
+            for item, password_hash in zip(cleaned, hashes)
+        ],
+    ).all()
+    ids = {username: user_id for user_id, username in created}
+
+    db.session.execute(
+        insert(PersonDetails),
+        [
+            {
+                "user_id": ids[item["username"]],
+                "full_name": item["full_name"] or item["username"],
+                "building": item["building"],
+                "floor": item["floor"],
+                "apartment": item["apartment"],
+                "floor_num": unit_number(item["floor"]),
+                "apartment_num": unit_number(item["apartment"]),
+                "phone": item["phone"],
+            }
+            for item in cleaned
+        ],
+    )
+
+    # bulk insert bypasses the ORM hooks that keep the units registry in sync
+    sync_units((item["building"], item["floor"], item["apartment"]) for item in cleaned)
+
+    # same schedule as create_initial_invoices_for_resident, for all of them at once
+    today = datetime.now()
+    report = generate_invoices(
+        (today.year, today.month),
+        (today.year + 1, 12),
+        user_ids=list(ids.values()),
+    )
+
+    users = [{"id": ids[item["username"]], "username": item["username"], "role": "RESIDENT"} for item in cleaned]
+    return users, report["inserted"], []
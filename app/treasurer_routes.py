@@ -1,54 +1,79 @@
 from datetime import date, datetime
 from flask import Blueprint, jsonify, request
-from sqlalchemy import func, cast, Integer, case, and_, or_
+from sqlalchemy import func, and_, or_, false
 import os
-from sqlalchemy.orm import aliased
 
 from app import db
-from app.models import User, PersonDetails, Payment, Settlement, MaintenanceInvoice, UnionLedgerEntry, Expense, NotificationSubscription,Income
+from app.models import User, PersonDetails, Payment, Settlement, MaintenanceInvoice, UnionLedgerEntry, Expense, NotificationSubscription,Income, AdminCashBalance
 from .auth.routes import get_current_user_from_request
-from app.fcm import send_push_v1
+from .cash_balances import get_admin_cash_balance, record_settlement
+from .union_ledger import append_ledger_entry, get_union_balance
+from app.fcm import get_fcm_client
+from .push_subscriptions import live_subscriptions_query, record_push_results
+from .units_status import units_status, building_units_status
+from .month_stats import get_month_stats
+from .unit_registry import building_unit_totals
 
 treasurer_bp = Blueprint("treasurer", __name__)
 
 
-def _admin_summary_for_treasurer(admin_id: int):
+def _admin_summary_rows(*criteria):
     """
-    Helper: compute totals for one admin.
+    Helper: admins with their details and totals (from admin_cash_balances) in one query.
+    Extra criteria (e.g. User.id == admin_id) narrow the admins returned.
     """
-    # total collected
-    total_amount = (
-        db.session.query(func.coalesce(func.sum(Payment.amount), 0))
-        .filter(Payment.collected_by_admin_id == admin_id)
-        .scalar()
-        or 0
-    )
-
-    # total settled
-    settled_amount = (
-        db.session.query(func.coalesce(func.sum(Settlement.amount), 0))
-        .filter(Settlement.admin_id == admin_id)
-        .scalar()
-        or 0
+    return (
+        db.session.query(
+            User,
+            PersonDetails.full_name.label("full_name"),
+            func.coalesce(AdminCashBalance.collected_amount, 0).label("total_amount"),
+            func.coalesce(AdminCashBalance.payments_count, 0).label("payments_count"),
+            func.coalesce(AdminCashBalance.settled_amount, 0).label("settled_amount"),
+        )
+        .outerjoin(PersonDetails, PersonDetails.user_id == User.id)
+        .outerjoin(AdminCashBalance, AdminCashBalance.admin_id == User.id)
+        .filter(or_(User.role == "ADMIN", User.role == "ONLINE_ADMIN"), *criteria)
+        .order_by(User.id)
+        .all()
     )
 
-    outstanding_amount = float(total_amount) - float(settled_amount)
 
-    payments_count = (
-        db.session.query(func.count(Payment.id))
-        .filter(Payment.collected_by_admin_id == admin_id)
-        .scalar()
-        or 0
-    )
+def _summary_from_row(row):
+    total_amount = float(row.total_amount or 0)
+    settled_amount = float(row.settled_amount or 0)
 
     return {
-        "total_amount": float(total_amount),
-        "settled_amount": float(settled_amount),
-        "outstanding_amount": float(outstanding_amount),
-        "payments_count": int(payments_count),
+        "total_amount": total_amount,
+        "settled_amount": settled_amount,
+        "outstanding_amount": total_amount - settled_amount,
+        "payments_count": int(row.payments_count or 0),
     }
 
 
+def _admin_summaries_for_treasurer(admin_ids=None):
+    """
+    Helper: compute totals for many admins at once.
+    Returns { admin_id: summary }; admin_ids=None means all admins.
+    """
+    criteria = [] if admin_ids is None else [User.id.in_(list(admin_ids))]
+    return {row.User.id: _summary_from_row(row) for row in _admin_summary_rows(*criteria)}
+
+
+def _admin_summary_for_treasurer(admin_id: int):
+    """
+    Helper: compute totals for one admin.
+    """
+    return _admin_summaries_for_treasurer([admin_id]).get(
+        admin_id,
+        {
+            "total_amount": 0.0,
+            "settled_amount": 0.0,
+            "outstanding_amount": 0.0,
+            "payments_count": 0,
+        },
+    )
+
+
 @treasurer_bp.route("/admins", methods=["GET"])
 def treasurer_list_admins():
     """
@@ -60,20 +85,16 @@ def treasurer_list_admins():
         message, status = error
         return jsonify({"message": message}), status
 
-    admins = (User.query.filter(or_(User.role == "ADMIN", User.role == "ONLINE_ADMIN")).all())
-
     results = []
-    for admin in admins:
-        details = PersonDetails.query.filter_by(user_id=admin.id).first()
-        summary = _admin_summary_for_treasurer(admin.id)
-
+    for row in _admin_summary_rows():
+        admin = row.User
         results.append(
             {
                 "id": admin.id,
                 "username": admin.username,
-                "full_name": details.full_name if details else admin.username,
+                "full_name": row.full_name if row.full_name is not None else admin.username,
                 "role": admin.role,
-                "summary": summary,
+                "summary": _summary_from_row(row),
             }
         )
 
@@ -92,19 +113,13 @@ def treasurer_admin_details(admin_id: int):
         message, status = error
         return jsonify({"message": message}), status
 
-    admin = (
-        User.query
-        .filter(
-            User.id == admin_id,
-            or_(User.role == "ADMIN", User.role == "ONLINE_ADMIN")
-        )
-        .first()
-    )
-    if not admin:
+    rows = _admin_summary_rows(User.id == admin_id)
+    if not rows:
         return jsonify({"message": "admin not found"}), 404
 
-    details = PersonDetails.query.filter_by(user_id=admin.id).first()
-    summary = _admin_summary_for_treasurer(admin.id)
+    admin = rows[0].User
+    full_name = rows[0].full_name
+    summary = _summary_from_row(rows[0])
 
     # Recent settlements for this admin
     recent_settlements = (
@@ -133,7 +148,7 @@ def treasurer_admin_details(admin_id: int):
             "admin": {
                 "id": admin.id,
                 "username": admin.username,
-                "full_name": details.full_name if details else admin.username,
+                "full_name": full_name if full_name is not None else admin.username,
                 "role": admin.role,
             },
             "summary": summary,
@@ -161,17 +176,12 @@ def treasurer_create_settlement():
     if not admin_id or amount is None:
         return jsonify({"message": "admin_id and amount are required"}), 400
 
-    admin = (
-        User.query
-        .filter(
-            User.id == admin_id,
-            or_(User.role == "ADMIN", User.role == "ONLINE_ADMIN")
-        )
-        .first()
-    )
-    if not admin:
+    rows = _admin_summary_rows(User.id == admin_id)
+    if not rows:
         return jsonify({"message": "admin not found"}), 404
 
+    admin = rows[0].User
+
     try:
         amount_val = float(amount)
         if amount_val <= 0:
@@ -179,8 +189,8 @@ def treasurer_create_settlement():
     except Exception:
         return jsonify({"message": "invalid amount"}), 400
 
-    # compute outstanding
-    summary = _admin_summary_for_treasurer(admin.id)
+    # compute outstanding (row lock so two settlements can't both pass the check)
+    summary = get_admin_cash_balance(admin.id, for_update=True)
     outstanding = summary["outstanding_amount"]
 
     if amount_val > outstanding + 1e-6:  # صغير tolerance
@@ -200,20 +210,14 @@ def treasurer_create_settlement():
     )
 
     db.session.add(settlement)
+    record_settlement(admin.id, amount_val)
     # Ledger: settlement increases union balance (credit)
-    current_balance = get_union_balance()
-    new_balance = current_balance + amount_val
-
-    ledger_entry = UnionLedgerEntry(
-        date=datetime.now(),
+    append_ledger_entry(
         description=f"تسوية من مسؤول التحصيل {admin.username}",
-        debit=0,
-        credit=amount_val,
-        balance_after=new_balance,
         entry_type="SETTLEMENT",
         created_by_id=current_user.id,
+        credit=amount_val,
     )
-    db.session.add(ledger_entry)
     db.session.commit()
 
     # Recompute summary after settlement
@@ -229,7 +233,7 @@ def treasurer_create_settlement():
 
 @treasurer_bp.route("/summary", methods=["GET"])
 def treasurer_summary():
-    current_user, error = get_current_user_from_request(allowed_roles=["TREASURER", "SUPERADMIN"])
+    current_user, error = get_current_user_from_request(allowed_roles=["TREASURER", "SUPERADMIN"], read_only=True)
     if error:
         message, status = error
         return jsonify({"message": message}), status
@@ -320,16 +324,6 @@ def treasurer_summary():
         }
     )
 
-def get_union_balance():
-    last_entry = (
-        db.session.query(UnionLedgerEntry)
-        .order_by(UnionLedgerEntry.id.desc())
-        .first()
-    )
-    if last_entry:
-        return float(last_entry.balance_after)
-    return 0.0
-
 @treasurer_bp.route("/ledger", methods=["GET"])
 def treasurer_ledger_list():
     """
@@ -407,19 +401,12 @@ def treasurer_create_expense():
     db.session.add(exp)
 
     # Ledger: expense decreases union balance (debit)
-    current_balance = get_union_balance()
-    new_balance = current_balance - amount_val
-
-    ledger_entry = UnionLedgerEntry(
-        date=datetime.now(),
+    append_ledger_entry(
         description=f"مصروف: {description}",
-        debit=amount_val,
-        credit=0,
-        balance_after=new_balance,
         entry_type="EXPENSE",
         created_by_id=current_user.id,
+        debit=amount_val,
     )
-    db.session.add(ledger_entry)
 
     db.session.commit()
 
@@ -475,20 +462,64 @@ def _get_late_residents_data():
     today = datetime.now()
     cutoff_day = 5
 
-    inv_rows = (
-        db.session.query(
-            MaintenanceInvoice.id,
-            MaintenanceInvoice.user_id,
-            MaintenanceInvoice.year,
-            MaintenanceInvoice.month,
-            MaintenanceInvoice.amount,
-            func.coalesce(func.sum(Payment.amount), 0).label("paid_amount"),
+    paid_amount = func.coalesce(func.sum(Payment.amount), 0)
+    period_index = MaintenanceInvoice.year * 12 + MaintenanceInvoice.month
+    today_index = today.year * 12 + today.month
+
+    if today.day > cutoff_day:
+        current_month_late = and_(
+            MaintenanceInvoice.year == today.year,
+            MaintenanceInvoice.month == today.month,
         )
+    else:
+        current_month_late = false()
+
+    columns = (
+        MaintenanceInvoice.id,
+        MaintenanceInvoice.user_id,
+        MaintenanceInvoice.year,
+        MaintenanceInvoice.month,
+        MaintenanceInvoice.amount,
+        paid_amount.label("paid_amount"),
+    )
+
+    # 1) Non-PAID invoices (partial index) that are late, ≥3 months old or partially paid
+    unpaid_q = (
+        db.session.query(*columns)
         .outerjoin(Payment, Payment.invoice_id == MaintenanceInvoice.id)
+        .filter(MaintenanceInvoice.status != "PAID")
         .group_by(MaintenanceInvoice.id)
-        .all()
+        .having(
+            and_(
+                MaintenanceInvoice.amount > paid_amount,
+                or_(
+                    current_month_late,
+                    period_index <= today_index - 3,
+                    paid_amount > 0,
+                ),
+            )
+        )
+    )
+
+    # 2) Invoices marked PAID but collected for less than their amount (partial
+    #    payments, or no payment rows): ix_maintenance_invoices_paid_short, no join
+    collected = MaintenanceInvoice.collected_amount
+    underpaid_q = (
+        db.session.query(*columns[:-1], collected.label("paid_amount"))
+        .filter(
+            MaintenanceInvoice.status == "PAID",
+            collected < MaintenanceInvoice.amount,
+            or_(
+                current_month_late,
+                period_index <= today_index - 3,
+                collected > 0,
+            ),
+        )
     )
 
+    # invoice order, as when all invoices were scanned in one query
+    inv_rows = unpaid_q.union_all(underpaid_q).order_by(MaintenanceInvoice.id).all()
+
     per_user = {}
 
     for row in inv_rows:
@@ -620,60 +651,58 @@ def treasurer_notify_late_residents_push():
     if not project_id:
         return jsonify({"message": "FIREBASE_PROJECT_ID not configured"}), 500
 
-    total_targets = 0
-    total_sent = 0
-    total_failed = 0
-    details = []
+    # All subscriptions for all late residents in one query
+    user_ids = [r["user_id"] for r in late_residents]
+    tokens_by_user = {}
+    live_subs = live_subscriptions_query().filter(NotificationSubscription.user_id.in_(user_ids))
+    for sub in live_subs.all():
+        tokens_by_user.setdefault(sub.user_id, []).append(sub.token)
 
+    title = "تنبيه سداد صيانة"
+    messages = []
     for r in late_residents:
-        user_id = r["user_id"]
-        subs = NotificationSubscription.query.filter_by(user_id=user_id).all()
-        if not subs:
-            details.append(
-                {
-                    "user_id": user_id,
-                    "full_name": r["full_name"],
-                    "status": "no_subscription",
-                }
-            )
+        tokens = tokens_by_user.get(r["user_id"])
+        if not tokens:
             continue
 
-        total_targets += 1
-
-        title = "تنبيه سداد صيانة"
         body = (
             f"عزيزي {r['full_name']}, يوجد مديونية صيانة قدرها "
             f"{r['total_overdue_amount']:.2f} جنيه على وحدتكم. "
             "برجاء السداد أو التواصل مع أمين الصندوق."
         )
+        messages.append((r["user_id"], tokens, title, body))
 
-        success_for_user = False
-        for sub in subs:
-            status_code, resp_text = send_push_v1(
-                project_id, sub.token, title, body
-            )
-            if status_code == 200:
-                success_for_user = True
-                break  # one success per user is enough
+    # Send concurrently (bounded), one success per user is enough
+    token_results = {}
+    sent = get_fcm_client().send_to_users(messages, token_results=token_results)
+
+    # Track delivery per token (dead tokens get removed)
+    record_push_results(token_results)
+    db.session.commit()
+
+    total_targets = len(messages)
+    total_sent = 0
+    total_failed = 0
+    details = []
 
-        if success_for_user:
+    for r in late_residents:
+        user_id = r["user_id"]
+        if user_id not in sent:
+            status = "no_subscription"
+        elif sent[user_id]:
+            status = "sent"
             total_sent += 1
-            details.append(
-                {
-                    "user_id": user_id,
-                    "full_name": r["full_name"],
-                    "status": "sent",
-                }
-            )
         else:
+            status = "failed"
             total_failed += 1
-            details.append(
-                {
-                    "user_id": user_id,
-                    "full_name": r["full_name"],
-                    "status": "failed",
-                }
-            )
+
+        details.append(
+            {
+                "user_id": user_id,
+                "full_name": r["full_name"],
+                "status": status,
+            }
+        )
 
     return jsonify(
         {
@@ -687,7 +716,7 @@ def treasurer_notify_late_residents_push():
 
 @treasurer_bp.route("/buildings/invoices-stats", methods=["GET"])
 def treasurer_buildings_paid_ranking():
-    user, error = get_current_user_from_request(allowed_roles=["TREASURER"])
+    user, error = get_current_user_from_request(allowed_roles=["TREASURER"], read_only=True)
     if error:
         message, status = error
         return jsonify({"message": message}), status
@@ -702,50 +731,20 @@ def treasurer_buildings_paid_ranking():
     if not month:
         month = now.month
 
-    rows = (
-        db.session.query(
-            PersonDetails.building.label("building"),
-            func.sum(
-                case(
-                    # ✅ هنا التعديل: tuple واحدة مش list
-                    (
-                        and_(
-                            MaintenanceInvoice.status == "PAID",
-                            MaintenanceInvoice.year == year,
-                            MaintenanceInvoice.month == month,
-                        ),
-                        1,
-                    ),
-                    else_=0,
-                )
-            ).label("paid_invoices"),
-            func.max(
-                cast(PersonDetails.apartment, Integer)
-            ).label("max_apartment"),
-        )
-        # نشتغل بس على السكان الحقيقيين
-        .join(User, User.id == PersonDetails.user_id)
-        .outerjoin(MaintenanceInvoice, MaintenanceInvoice.user_id == User.id)
-        .filter(
-            User.role == "RESIDENT",
-            PersonDetails.building.isnot(None),
-            PersonDetails.building != "",
-        )
-        .group_by(PersonDetails.building)
-        .all()
-    )
+    # paid counts from the building_month_stats rollup, apartments from the units registry
+    stats = get_month_stats(year, month)
+    rows = building_unit_totals()
 
     buildings = []
     for row in rows:
         building = row.building
-        paid_invoices = int(row.paid_invoices or 0)
-        max_apt = row.max_apartment or 0
-
-        # 7 أدوار في كل عمارة
-        total_apartments = max_apt * 7 if max_apt > 0 else 0
+        paid_invoices = stats.get(building, {}).get("paid_count", 0)
+        total_apartments = int(row.total_units)
+        occupied_apartments = int(row.occupied_units or 0)
 
-        if total_apartments > 0:
-            percentage = (paid_invoices / total_apartments) * 100.0
+        # النسبة من الشقق المسكونة بس (الشقق الفاضية مالهاش فواتير)
+        if occupied_apartments > 0:
+            percentage = (paid_invoices / occupied_apartments) * 100.0
         else:
             percentage = 0.0
 
@@ -754,6 +753,7 @@ def treasurer_buildings_paid_ranking():
                 "building": building,
                 "paid_invoices": paid_invoices,
                 "total_apartments": total_apartments,
+                "occupied_apartments": occupied_apartments,
                 "percentage": round(percentage, 2),
             }
         )
@@ -782,10 +782,11 @@ def treasurer_buildings_paid_amount_ranking():
     TREASURER: ترتيب العمارات حسب نسبة التحصيل بالمبالغ (PAID).
 
     النسبة = (إجمالي مبلغ الفواتير المسددة للعمارة)
-             ÷ (عدد الشقق في العمارة × 200)
+             ÷ (مجموع الرسوم الشهرية للشقق المسكونة في جدول units
+                × عدد الشهور اللي اتصدر فيها فواتير في الفترة)
              × 100
     """
-    user, error = get_current_user_from_request(allowed_roles=["TREASURER"])
+    user, error = get_current_user_from_request(allowed_roles=["TREASURER"], read_only=True)
     if error:
         msg, status = error
         return jsonify({"message": msg}), status
@@ -793,46 +794,21 @@ def treasurer_buildings_paid_amount_ranking():
     year = request.args.get("year", type=int)
     month = request.args.get("month", type=int)
 
-    # شروط الفاتورة المسددة في الفترة المطلوبة
-    paid_conditions = [MaintenanceInvoice.status == "PAID"]
-    if year is not None:
-        paid_conditions.append(MaintenanceInvoice.year == year)
-    if month is not None:
-        paid_conditions.append(MaintenanceInvoice.month == month)
-
-    paid_amount_case = case(
-        (and_(*paid_conditions), MaintenanceInvoice.amount),
-        else_=0,
-    )
-
-    q = (
-        db.session.query(
-            PersonDetails.building.label("building"),
-            func.max(
-                cast(PersonDetails.apartment, Integer)
-            ).label("max_apartment"),
-            func.coalesce(func.sum(paid_amount_case), 0).label("paid_amount"),
-        )
-        .join(User, User.id == PersonDetails.user_id)
-        .outerjoin(
-            MaintenanceInvoice,
-            MaintenanceInvoice.user_id == User.id,
-        )
-        .filter(User.role == "RESIDENT")
-        .filter(PersonDetails.building.isnot(None))
-        .group_by(PersonDetails.building)
-    )
-
-    rows = q.all()
+    # المبالغ المسددة من building_month_stats (year / month اختياريين)
+    stats = get_month_stats(year, month)
+    rows = building_unit_totals()
 
     buildings = []
     for r in rows:
-        max_apt = r.max_apartment or 0
-        # 7 أدوار في كل العمارات
-        total_apartments = max_apt * 7 if max_apt > 0 else 0
-        expected_amount = float(total_apartments * 200)
+        total_apartments = int(r.total_units)
+        occupied_apartments = int(r.occupied_units or 0)
+
+        building_stats = stats.get(r.building, {})
+        # a window wider than one month → expected × months that had invoices issued
+        months = 1 if year is not None and month is not None else building_stats.get("months", 0)
+        expected_amount = float(r.expected_amount or 0) * months
 
-        paid_amount = float(r.paid_amount or 0)
+        paid_amount = float(building_stats.get("paid_amount", 0))
         if expected_amount > 0:
             percentage = round((paid_amount / expected_amount) * 100, 2)
         else:
@@ -843,7 +819,9 @@ def treasurer_buildings_paid_amount_ranking():
                 "building": r.building,
                 "paid_amount": paid_amount,
                 "expected_amount": expected_amount,
-                "total_apartments": int(total_apartments),
+                "months": months,
+                "total_apartments": total_apartments,
+                "occupied_apartments": occupied_apartments,
                 "percentage": percentage,
             }
         )
@@ -866,119 +844,55 @@ def treasurer_buildings_paid_amount_ranking():
         }
     )
 
-@treasurer_bp.route("/buildings/<string:building>/units-status", methods=["GET"])
-def treasurer_building_units_status(building: str):
-    user, error = get_current_user_from_request(allowed_roles=["TREASURER"])
-    if error:
-        msg, status = error
-        return jsonify({"message": msg}), status
-
+def _requested_period():
     year = request.args.get("year", type=int)
     month = request.args.get("month", type=int)
 
     now = datetime.now()
-    if not year:
-        year = now.year
-    if not month:
-        month = now.month
-
-    Collector = aliased(User)
-
-    # نجمع المدفوعات لكل شقة على فاتورة الشهر المطلوب + نطلع طريقة الدفع من دور الأدمن
-    paid_amount_sum = func.coalesce(func.sum(Payment.amount), 0)
-
-    any_online = func.max(
-        case((Collector.role == "ONLINE_ADMIN", 1), else_=0)
-    )
-    any_payment = func.max(
-        case((Payment.id.isnot(None), 1), else_=0)
-    )
-
-    payment_method = case(
-        (any_online == 1, "ONLINE"),
-        (any_payment == 1, "CASH"),
-        else_=None,
-    )
+    return year or now.year, month or now.month
 
-    rows = (
-        db.session.query(
-            PersonDetails.user_id.label("user_id"),
-            PersonDetails.full_name.label("full_name"),
-            PersonDetails.building.label("building"),
-            PersonDetails.floor.label("floor"),
-            PersonDetails.apartment.label("apartment"),
-
-            MaintenanceInvoice.id.label("invoice_id"),
-            MaintenanceInvoice.amount.label("invoice_amount"),
-            MaintenanceInvoice.status.label("invoice_status"),
 
-            paid_amount_sum.label("paid_amount"),
-            payment_method.label("payment_method"),
-        )
-        .join(User, User.id == PersonDetails.user_id)
-        .outerjoin(
-            MaintenanceInvoice,
-            and_(
-                MaintenanceInvoice.user_id == User.id,
-                MaintenanceInvoice.year == year,
-                MaintenanceInvoice.month == month,
-            )
-        )
-        .outerjoin(Payment, Payment.invoice_id == MaintenanceInvoice.id)
-        .outerjoin(Collector, Collector.id == Payment.collected_by_admin_id)
-        .filter(
-            User.role == "RESIDENT",
-            PersonDetails.building == building,
-        )
-        .group_by(
-            PersonDetails.user_id,
-            PersonDetails.full_name,
-            PersonDetails.building,
-            PersonDetails.floor,
-            PersonDetails.apartment,
-            MaintenanceInvoice.id,
-            MaintenanceInvoice.amount,
-            MaintenanceInvoice.status,
-        )
-        .order_by(
-            cast(PersonDetails.floor, Integer).asc(),
-            cast(PersonDetails.apartment, Integer).asc(),
-        )
-        .all()
-    )
+@treasurer_bp.route("/buildings/<string:building>/units-status", methods=["GET"])
+def treasurer_building_units_status(building: str):
+    user, error = get_current_user_from_request(allowed_roles=["TREASURER"], read_only=True)
+    if error:
+        msg, status = error
+        return jsonify({"message": msg}), status
 
-    result = []
-    for r in rows:
-        invoice_id = r.invoice_id
-        invoice_amount = float(r.invoice_amount) if r.invoice_amount is not None else 0.0
-        paid_amount = float(r.paid_amount or 0)
+    year, month = _requested_period()
 
-        # paid الشهر الحالي؟ (أفضل نعتمد على Status)
-        paid_current_month = (r.invoice_status == "PAID") if invoice_id else False
+    return jsonify({
+        "building": building,
+        "year": year,
+        "month": month,
+        "units": building_units_status(building, year, month)
+    }), 200
 
-        result.append({
-            "user_id": int(r.user_id),
-            "full_name": r.full_name,
-            "building": r.building,
-            "floor": r.floor,
-            "apartment": r.apartment,
 
-            "year": year,
-            "month": month,
+@treasurer_bp.route("/buildings/units-status", methods=["GET"])
+def treasurer_units_status():
+    """
+    Units status of the whole compound (or ?buildings=1,2 / ?building=1&building=2)
+    in one call: { year, month, buildings: { building: [units] } }.
+    """
+    user, error = get_current_user_from_request(allowed_roles=["TREASURER"], read_only=True)
+    if error:
+        msg, status = error
+        return jsonify({"message": msg}), status
 
-            "invoice_id": int(invoice_id) if invoice_id else None,
-            "invoice_amount": invoice_amount,
-            "paid_current_month": bool(paid_current_month),
+    year, month = _requested_period()
 
-            "paid_amount": paid_amount,
-            "payment_method": r.payment_method,  # ONLINE / CASH / None
-        })
+    buildings = [
+        b.strip()
+        for value in request.args.getlist("buildings") + request.args.getlist("building")
+        for b in value.split(",")
+        if b.strip()
+    ]
 
     return jsonify({
-        "building": building,
         "year": year,
         "month": month,
-        "units": result
+        "buildings": units_status(year, month, buildings or None)
     }), 200
 
 
@@ -1017,19 +931,13 @@ def treasurer_create_income():
     )
     db.session.add(inc)
 
-    current_balance = get_union_balance()
-    new_balance = current_balance + amount_val
-
-    ledger_entry = UnionLedgerEntry(
-        date=datetime.now(),
+    # Ledger: income increases union balance (credit)
+    append_ledger_entry(
         description=f"إيراد: {description}",
-        debit=0,
-        credit=amount_val,
-        balance_after=new_balance,
         entry_type="INCOME",
         created_by_id=current_user.id,
+        credit=amount_val,
     )
-    db.session.add(ledger_entry)
 
     db.session.commit()
     return jsonify({"message": "income recorded"}), 201
@@ -0,0 +1,99 @@
+from datetime import datetime
+from decimal import Decimal
+
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models import UnionBalance, UnionLedgerEntry
+
+HEAD_ID = 1
+
+
+def _to_decimal(value) -> Decimal:
+    return Decimal(str(round(float(value or 0), 2)))
+
+
+def _last_entry_balance() -> Decimal:
+    last = UnionLedgerEntry.query.order_by(UnionLedgerEntry.id.desc()).first()
+    return _to_decimal(last.balance_after) if last else Decimal("0")
+
+
+def get_union_balance() -> float:
+    """
+    Current union balance (O(1): reads the head row).
+    """
+    head = db.session.get(UnionBalance, HEAD_ID)
+    if head is not None:
+        return float(head.balance)
+    return float(_last_entry_balance())
+
+
+def _bump_head(delta: Decimal) -> Decimal:
+    """
+    balance = balance + delta on the head row and return the new balance.
+    The UPDATE takes the row lock (Postgres) / write lock (SQLite) first,
+    so every concurrent append waits here and sees the previous one's result.
+    """
+    updated = (
+        db.session.query(UnionBalance)
+        .filter(UnionBalance.id == HEAD_ID)
+        .update({UnionBalance.balance: UnionBalance.balance + delta}, synchronize_session=False)
+    )
+
+    if not updated:
+        # first append ever (or head missing) → seed it from the ledger
+        try:
+            with db.session.begin_nested():
+                db.session.add(UnionBalance(id=HEAD_ID, balance=_last_entry_balance() + delta))
+        except IntegrityError:
+            # another worker seeded it first
+            (
+                db.session.query(UnionBalance)
+                .filter(UnionBalance.id == HEAD_ID)
+                .update({UnionBalance.balance: UnionBalance.balance + delta}, synchronize_session=False)
+            )
+
+    new_balance = (
+        db.session.query(UnionBalance.balance)
+        .filter(UnionBalance.id == HEAD_ID)
+        .scalar()
+    )
+    return _to_decimal(new_balance)
+
+
+def append_ledger_entry(
+    description: str,
+    entry_type: str,
+    created_by_id: int,
+    debit=0,
+    credit=0,
+    date: datetime = None,
+) -> UnionLedgerEntry:
+    """
+    Append one entry to the union ledger with a consistent balance_after.
+    Runs in the caller's transaction; the head row stays locked until commit.
+    """
+    debit = _to_decimal(debit)
+    credit = _to_decimal(credit)
+
+    new_balance = _bump_head(credit - debit)
+
+    entry = UnionLedgerEntry(
+        date=date or datetime.now(),
+        description=description,
+        debit=debit,
+        credit=credit,
+        balance_after=new_balance,
+        entry_type=entry_type,
+        created_by_id=created_by_id,
+    )
+    db.session.add(entry)
+    db.session.flush()
+
+    (
+        db.session.query(UnionBalance)
+        .filter(UnionBalance.id == HEAD_ID)
+        .update({UnionBalance.last_entry_id: entry.id}, synchronize_session=False)
+    )
+
+    return entry
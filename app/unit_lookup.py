@@ -0,0 +1,154 @@
+"""
+building / floor / apartment → RESIDENT user ids.
+
+Backed by ix_person_details_building_floor_apartment plus a small in-process
+LRU (UNIT_CACHE_SIZE entries, UNIT_CACHE_TTL seconds). The cache is cleared
+after any commit touching person_details or a user's role; other workers rely
+on the TTL, and resolve_unit_resident re-checks a cached hit against the
+loaded user before trusting it.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, joinedload
+
+from app import db
+from app.models import User, PersonDetails
+from app.config import Config
+
+
+class _UnitCache:
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        if self.maxsize <= 0 or self.ttl <= 0:
+            return None
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        if self.maxsize <= 0 or self.ttl <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_cache = _UnitCache(Config.UNIT_CACHE_SIZE, Config.UNIT_CACHE_TTL)
+
+
+def unit_key(building, floor, apartment):
+    return (str(building).strip(), str(floor).strip(), str(apartment).strip())
+
+
+def _query_unit_user_ids(key):
+    building, floor, apartment = key
+    rows = (
+        db.session.query(PersonDetails.user_id)
+        .join(User, PersonDetails.user_id == User.id)
+        .filter(
+            User.role == "RESIDENT",
+            PersonDetails.building == building,
+            PersonDetails.floor == floor,
+            PersonDetails.apartment == apartment,
+        )
+        .order_by(PersonDetails.id)
+        .all()
+    )
+    return tuple(r.user_id for r in rows)
+
+
+def resolve_unit(building, floor, apartment, use_cache: bool = True):
+    """
+    Tuple of RESIDENT user ids living in this unit (usually 0 or 1).
+    Only non-empty results are cached; use_cache=False always asks the DB
+    (uniqueness checks before writes).
+    """
+    key = unit_key(building, floor, apartment)
+
+    if use_cache:
+        user_ids = _cache.get(key)
+        if user_ids is not None:
+            return user_ids
+
+    user_ids = _query_unit_user_ids(key)
+    if user_ids:
+        _cache.set(key, user_ids)
+    return user_ids
+
+
+def _get_resident(user_id: int):
+    return db.session.get(User, user_id, options=[joinedload(User.person_details)])
+
+
+def resolve_unit_resident(building, floor, apartment):
+    """
+    The (first) RESIDENT User of this unit, or None.
+    """
+    key = unit_key(building, floor, apartment)
+
+    user_ids = resolve_unit(*key)
+    if not user_ids:
+        return None
+
+    user = _get_resident(user_ids[0])
+    details = user.person_details if user else None
+    if (
+        user is not None
+        and user.role == "RESIDENT"
+        and details is not None
+        and unit_key(details.building, details.floor, details.apartment) == key
+    ):
+        return user
+
+    # stale entry (changed in another worker) → ask the DB again
+    _cache.pop(key)
+    user_ids = resolve_unit(*key, use_cache=False)
+    return _get_resident(user_ids[0]) if user_ids else None
+
+
+def invalidate_units():
+    _cache.clear()
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_unit_changes(session, flush_context):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, PersonDetails):
+            session.info["unit_cache_clear"] = True
+            return
+        if isinstance(obj, User) and (
+            obj in session.deleted or inspect(obj).attrs.role.history.has_changes()
+        ):
+            session.info["unit_cache_clear"] = True
+            return
+
+
+@event.listens_for(Session, "after_commit")
+def _clear_after_commit(session):
+    if session.info.pop("unit_cache_clear", False):
+        invalidate_units()
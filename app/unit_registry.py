@@ -0,0 +1,205 @@
+"""
+units: registry of apartments (building / floor / apartment, occupied flag,
+monthly fee), used for exact per-building totals in the ranking reports.
+
+Synced with person_details in the same transaction as the change: units of
+residents added / moved / removed (or whose user changed role) are collected
+at flush and re-synced right before commit — a unit seen for the first time
+is registered, and `occupied` follows whether a RESIDENT lives there. Units
+are never deleted automatically; a vacated unit stays registered.
+Set-wise writers (bulk onboarding) call sync_units themselves.
+
+`flask units sync` re-syncs the whole registry, `flask units set-fee` sets fees.
+"""
+from decimal import Decimal, InvalidOperation
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import event, inspect, tuple_, case, func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models import User, PersonDetails, Unit
+
+units_cli = AppGroup("units", help="Maintain the units registry.")
+
+DEFAULT_MONTHLY_FEE = Decimal("200.00")
+
+UNIT_FIELDS = ("building", "floor", "apartment")
+
+
+def _occupied_units(keys=None):
+    """
+    Set of (building, floor, apartment) with a RESIDENT living there.
+    """
+    q = (
+        db.session.query(PersonDetails.building, PersonDetails.floor, PersonDetails.apartment)
+        .join(User, User.id == PersonDetails.user_id)
+        .filter(User.role == "RESIDENT", PersonDetails.building != "")
+        .distinct()
+    )
+    if keys is not None:
+        q = q.filter(tuple_(PersonDetails.building, PersonDetails.floor, PersonDetails.apartment).in_(list(keys)))
+    return {tuple(r) for r in q.all()}
+
+
+def sync_units(keys=None):
+    """
+    Register missing occupied units and fix `occupied` for `keys`
+    [(building, floor, apartment)] (None = every unit). Caller commits.
+    Returns { registered, updated }.
+    """
+    if keys is not None:
+        keys = set(keys)
+        if not keys:
+            return {"registered": 0, "updated": 0}
+
+    occupied = _occupied_units(keys)
+
+    q = Unit.query
+    if keys is not None:
+        q = q.filter(tuple_(Unit.building, Unit.floor, Unit.apartment).in_(list(keys)))
+    existing = {(u.building, u.floor, u.apartment): u for u in q.all()}
+
+    updated = 0
+    for key, unit in existing.items():
+        if unit.occupied != (key in occupied):
+            unit.occupied = key in occupied
+            updated += 1
+
+    registered = 0
+    for building, floor, apartment in sorted(occupied - set(existing)):
+        try:
+            with db.session.begin_nested():
+                db.session.add(Unit(building=building, floor=floor, apartment=apartment, occupied=True,
+                                    monthly_fee=DEFAULT_MONTHLY_FEE))
+            registered += 1
+        except IntegrityError:
+            # registered concurrently → just make sure it's marked occupied
+            Unit.query.filter_by(building=building, floor=floor, apartment=apartment).update(
+                {Unit.occupied: True}, synchronize_session=False
+            )
+
+    return {"registered": registered, "updated": updated}
+
+
+def building_unit_totals():
+    """
+    Per named building with at least one occupied unit: total_units,
+    occupied_units and expected_amount (sum of occupied units' monthly fees).
+    """
+    return (
+        db.session.query(
+            Unit.building.label("building"),
+            func.count(Unit.id).label("total_units"),
+            func.sum(case((Unit.occupied, 1), else_=0)).label("occupied_units"),
+            func.coalesce(func.sum(case((Unit.occupied, Unit.monthly_fee), else_=0)), 0).label("expected_amount"),
+        )
+        .filter(Unit.building != "")
+        .group_by(Unit.building)
+        .having(func.sum(case((Unit.occupied, 1), else_=0)) > 0)
+        .all()
+    )
+
+
+# ---- person_details / role changes: collect at flush, sync right before commit ----
+
+def _unit_keys(obj):
+    """
+    Unit keys of a person_details row before and after this flush.
+    """
+    state = inspect(obj)
+    keys = set()
+    for current in (False, True):
+        values = []
+        for field in UNIT_FIELDS:
+            history = state.attrs[field].history
+            known = history.added if current else history.deleted
+            if known:
+                values.append(known[0])
+            elif history.unchanged:
+                values.append(history.unchanged[0])
+            else:
+                values.append(getattr(obj, field))
+        if None not in values:
+            keys.add(tuple(values))
+    return keys
+
+
+@event.listens_for(Session, "before_flush")
+def _collect_unit_changes(session, flush_context, instances):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, PersonDetails):
+            state = inspect(obj)
+            if obj in session.dirty and not any(state.attrs[f].history.has_changes() for f in UNIT_FIELDS + ("user_id",)):
+                continue
+            session.info.setdefault("unit_registry_keys", set()).update(_unit_keys(obj))
+
+        elif isinstance(obj, User) and obj not in session.new and (
+            obj in session.deleted or inspect(obj).attrs.role.history.has_changes()
+        ):
+            session.info.setdefault("unit_registry_users", set()).add(obj.id)
+
+
+@event.listens_for(Session, "before_commit")
+def _sync_units_before_commit(session):
+    if session.in_nested_transaction():
+        return
+    session.flush()
+    keys = session.info.pop("unit_registry_keys", set())
+    users = session.info.pop("unit_registry_users", set())
+
+    if users:
+        keys.update(
+            tuple(r)
+            for r in db.session.query(PersonDetails.building, PersonDetails.floor, PersonDetails.apartment)
+            .filter(PersonDetails.user_id.in_(users))
+        )
+    if keys:
+        sync_units(keys)
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _discard_unit_changes(session, transaction):
+    if transaction.parent is None:
+        session.info.pop("unit_registry_keys", None)
+        session.info.pop("unit_registry_users", None)
+
+
+# the unit a resident moves out of is needed even when it wasn't loaded before being set
+for _field in UNIT_FIELDS:
+    event.listen(getattr(PersonDetails, _field), "set", lambda *args: None, active_history=True)
+
+
+@units_cli.command("sync")
+def sync_command():
+    """Register units from person_details and refresh occupied flags."""
+    report = sync_units()
+    db.session.commit()
+    click.echo(f"{report['registered']} unit(s) registered, {report['updated']} occupied flag(s) updated")
+
+
+@units_cli.command("set-fee")
+@click.argument("amount")
+@click.option("--building", required=True)
+@click.option("--floor", default=None, help="Only this floor.")
+@click.option("--apartment", default=None, help="Only this apartment.")
+def set_fee_command(amount, building, floor, apartment):
+    """Set the monthly fee of a building's units (or one floor / apartment)."""
+    try:
+        fee = Decimal(amount)
+    except InvalidOperation:
+        raise click.BadParameter(f"invalid amount {amount!r}")
+    if fee < 0:
+        raise click.BadParameter("amount must not be negative")
+
+    q = Unit.query.filter(Unit.building == building)
+    if floor is not None:
+        q = q.filter(Unit.floor == floor)
+    if apartment is not None:
+        q = q.filter(Unit.apartment == apartment)
+
+    count = q.update({Unit.monthly_fee: fee}, synchronize_session=False)
+    db.session.commit()
+    click.echo(f"{count} unit(s) updated")
@@ -0,0 +1,136 @@
+"""
+Units status for a month (invoice + what was paid on it, per resident unit),
+shared by the public and treasurer endpoints.
+
+One query serves one, many or all buildings: payments are aggregated per
+invoice of that month first, then joined onto residents, so there is no
+GROUP BY over the wide resident columns.
+"""
+from sqlalchemy import func, case, and_, select
+from sqlalchemy.orm import aliased
+
+from app import db
+from app.models import User, PersonDetails, Payment, MaintenanceInvoice, Unit
+
+
+def _month_payments_subquery(year: int, month: int):
+    """
+    Per invoice of (year, month): paid amount and payment method
+    (ONLINE if any payment was collected by an ONLINE_ADMIN, else CASH).
+    """
+    Collector = aliased(User)
+
+    any_online = func.max(case((Collector.role == "ONLINE_ADMIN", 1), else_=0))
+
+    return (
+        select(
+            Payment.invoice_id.label("invoice_id"),
+            func.sum(Payment.amount).label("paid_amount"),
+            case((any_online == 1, "ONLINE"), else_="CASH").label("payment_method"),
+        )
+        .join(MaintenanceInvoice, MaintenanceInvoice.id == Payment.invoice_id)
+        .outerjoin(Collector, Collector.id == Payment.collected_by_admin_id)
+        .where(MaintenanceInvoice.year == year, MaintenanceInvoice.month == month)
+        .group_by(Payment.invoice_id)
+        .subquery("month_payments")
+    )
+
+
+def _unit_row(r, year: int, month: int) -> dict:
+    invoice_id = r.invoice_id
+    invoice_amount = float(r.invoice_amount) if r.invoice_amount is not None else 0.0
+    paid_amount = float(r.paid_amount or 0)
+
+    # paid الشهر الحالي؟ (أفضل نعتمد على Status)
+    paid_current_month = (r.invoice_status == "PAID") if invoice_id else False
+
+    return {
+        "user_id": int(r.user_id),
+        "full_name": r.full_name,
+        "building": r.building,
+        "floor": r.floor,
+        "apartment": r.apartment,
+
+        "year": year,
+        "month": month,
+
+        "invoice_id": int(invoice_id) if invoice_id else None,
+        "invoice_amount": invoice_amount,
+        "paid_current_month": bool(paid_current_month),
+
+        "paid_amount": paid_amount,
+        "payment_method": r.payment_method,  # ONLINE / CASH / None
+
+        # from the units registry (None if the unit isn't registered)
+        "monthly_fee": float(r.monthly_fee) if r.monthly_fee is not None else None,
+    }
+
+
+def units_status(year: int, month: int, buildings=None):
+    """
+    { building: [unit, ...] } for every RESIDENT of `buildings` (None = all),
+    buildings in name order, units by floor / apartment.
+    Requested buildings without residents map to [].
+    """
+    payments = _month_payments_subquery(year, month)
+
+    q = (
+        db.session.query(
+            PersonDetails.user_id.label("user_id"),
+            PersonDetails.full_name.label("full_name"),
+            PersonDetails.building.label("building"),
+            PersonDetails.floor.label("floor"),
+            PersonDetails.apartment.label("apartment"),
+
+            MaintenanceInvoice.id.label("invoice_id"),
+            MaintenanceInvoice.amount.label("invoice_amount"),
+            MaintenanceInvoice.status.label("invoice_status"),
+
+            func.coalesce(payments.c.paid_amount, 0).label("paid_amount"),
+            payments.c.payment_method.label("payment_method"),
+            Unit.monthly_fee.label("monthly_fee"),
+        )
+        .join(User, User.id == PersonDetails.user_id)
+        .outerjoin(
+            Unit,
+            and_(
+                Unit.building == PersonDetails.building,
+                Unit.floor == PersonDetails.floor,
+                Unit.apartment == PersonDetails.apartment,
+            )
+        )
+        .outerjoin(
+            MaintenanceInvoice,
+            and_(
+                MaintenanceInvoice.user_id == User.id,
+                MaintenanceInvoice.year == year,
+                MaintenanceInvoice.month == month,
+            )
+        )
+        .outerjoin(payments, payments.c.invoice_id == MaintenanceInvoice.id)
+        .filter(User.role == "RESIDENT")
+        # ix_person_details_building_floor_num_apartment_num order; non-numeric units last
+        .order_by(
+            PersonDetails.building.asc(),
+            PersonDetails.floor_num.asc().nulls_last(),
+            PersonDetails.apartment_num.asc().nulls_last(),
+            PersonDetails.floor.asc(),
+            PersonDetails.apartment.asc(),
+        )
+    )
+
+    result = {}
+    if buildings is not None:
+        buildings = list(dict.fromkeys(buildings))
+        if not buildings:
+            return result
+        q = q.filter(PersonDetails.building.in_(buildings))
+        result = {b: [] for b in sorted(buildings)}
+
+    for r in q.all():
+        result.setdefault(r.building, []).append(_unit_row(r, year, month))
+    return result
+
+
+def building_units_status(building: str, year: int, month: int):
+    return units_status(year, month, [building])[building]
@@ -0,0 +1,201 @@
+"""
+Response cache for the public units-status endpoint.
+
+Entries are keyed by (building, year, month) and hold the serialized JSON body
+plus its ETag, so a poll whose If-None-Match still matches gets a 304 without
+touching the database. Entries are dropped after commit when:
+
+- a payment or invoice of one of the entry's residents changes (invoices only
+  for their own month),
+- a person_details or units row of that building changes (name / unit / new
+  resident / monthly fee),
+- a user's role changes or a user is deleted, or a bulk insert/update/delete
+  runs against invoices / payments / person_details / units (whole cache).
+
+Invalidation is per process; other gunicorn workers pick changes up when their
+entry expires (UNITS_STATUS_CACHE_TTL). ETags are content hashes, so they agree
+across workers.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from app.models import User, PersonDetails, MaintenanceInvoice, Payment, Unit
+from app.config import Config
+
+# tables whose bulk (non-ORM-flush) statements clear the whole cache
+WATCHED_MODELS = (MaintenanceInvoice, Payment, PersonDetails, Unit)
+
+
+class _Entry:
+    __slots__ = ("expires_at", "etag", "body", "user_ids")
+
+    def __init__(self, expires_at, etag, body, user_ids):
+        self.expires_at = expires_at
+        self.etag = etag
+        self.body = body
+        self.user_ids = user_ids
+
+
+class _ResponseCache:
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        # bumped on every invalidation; a response computed before it is not stored
+        self.generation = 0
+
+    @property
+    def enabled(self):
+        return self.maxsize > 0 and self.ttl > 0
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            if entry.expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return entry
+
+    def set(self, key, body: bytes, user_ids, generation: int):
+        entry = _Entry(time.monotonic() + self.ttl, make_etag(body), body, frozenset(user_ids))
+        if not self.enabled:
+            return entry
+        with self._lock:
+            if generation != self.generation:
+                return entry
+            self._data[key] = entry
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+        return entry
+
+    def invalidate(self, buildings=(), users=(), user_months=(), everything=False):
+        """
+        buildings: {building} · users: {user_id} · user_months: {(user_id, year, month)}
+        """
+        with self._lock:
+            self.generation += 1
+            if everything:
+                self._data.clear()
+                return
+            for key in list(self._data):
+                building, year, month = key
+                user_ids = self._data[key].user_ids
+                if (
+                    building in buildings
+                    or not user_ids.isdisjoint(users)
+                    or any((user_id, year, month) in user_months for user_id in user_ids)
+                ):
+                    del self._data[key]
+
+
+_cache = _ResponseCache(Config.UNITS_STATUS_CACHE_SIZE, Config.UNITS_STATUS_CACHE_TTL)
+
+
+def make_etag(body: bytes) -> str:
+    return hashlib.sha1(body).hexdigest()
+
+
+def get_units_status(building: str, year: int, month: int, build):
+    """
+    Cached response entry for (building, year, month).
+    build() → (body bytes, resident user ids in it); called on a miss.
+    """
+    key = (building, year, month)
+    entry = _cache.get(key)
+    if entry is not None:
+        return entry
+
+    generation = _cache.generation
+    body, user_ids = build()
+    return _cache.set(key, body, user_ids, generation)
+
+
+def invalidate_units_status():
+    _cache.invalidate(everything=True)
+
+
+def _history_values(state, field):
+    """
+    Current and previous value(s) of an attribute (loaded ones only).
+    """
+    history = state.attrs[field].history
+    return [v for v in history.sum() if v is not None]
+
+
+# ---- collect what a flush touched, invalidate after commit ----
+
+def _pending(session):
+    return session.info.setdefault(
+        "units_status_invalidate",
+        {"buildings": set(), "users": set(), "user_months": set(), "everything": False},
+    )
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_units_status_changes(session, flush_context):
+    pending = None
+
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Payment):
+            pending = pending or _pending(session)
+            pending["users"].update(_history_values(inspect(obj), "user_id"))
+
+        elif isinstance(obj, MaintenanceInvoice):
+            pending = pending or _pending(session)
+            state = inspect(obj)
+            for user_id in _history_values(state, "user_id"):
+                for year in _history_values(state, "year"):
+                    for month in _history_values(state, "month"):
+                        pending["user_months"].add((user_id, year, month))
+
+        elif isinstance(obj, PersonDetails):
+            pending = pending or _pending(session)
+            state = inspect(obj)
+            pending["buildings"].update(_history_values(state, "building"))
+            pending["users"].update(_history_values(state, "user_id"))
+
+        elif isinstance(obj, Unit):
+            pending = pending or _pending(session)
+            pending["buildings"].update(_history_values(inspect(obj), "building"))
+
+        elif isinstance(obj, User) and (
+            obj in session.deleted or inspect(obj).attrs.role.history.has_changes()
+        ):
+            # resident joins / leaves the list, or a collector's role (payment_method) changes
+            pending = pending or _pending(session)
+            pending["everything"] = True
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _collect_bulk_statements(orm_execute_state):
+    if not (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is not None and issubclass(mapper.class_, WATCHED_MODELS):
+        _pending(orm_execute_state.session)["everything"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session):
+    pending = session.info.pop("units_status_invalidate", None)
+    if pending:
+        _cache.invalidate(**pending)
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _discard_after_rollback(session, transaction):
+    # only the outermost transaction: a rolled back savepoint doesn't undo earlier flushes
+    if transaction.parent is None:
+        session.info.pop("units_status_invalidate", None)
@@ -0,0 +1,48 @@
+"""maintenance_invoices (user_id, year, month) unique + (year, month, status) indexes
+
+Revision ID: 0a6e4d2f9c13
+Revises: f3a81c6e2b70
+Create Date: 2026-10-17 14:21:55.870311
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0a6e4d2f9c13'
+down_revision = 'f3a81c6e2b70'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The unique index can't be built over duplicates, and which copy to keep
+    # (payments / online payments may point at either) is a manual decision.
+    duplicates = op.get_bind().execute(sa.text(
+        """
+        SELECT user_id, year, month, COUNT(*) AS n
+        FROM maintenance_invoices
+        GROUP BY user_id, year, month
+        HAVING COUNT(*) > 1
+        ORDER BY user_id, year, month
+        """
+    )).fetchall()
+    if duplicates:
+        listed = ", ".join(f"user {d.user_id} {d.year}-{d.month:02d} (x{d.n})" for d in duplicates[:20])
+        raise RuntimeError(
+            f"{len(duplicates)} duplicate (user_id, year, month) invoice group(s) must be "
+            f"resolved before this migration: {listed}"
+        )
+
+    with op.batch_alter_table('maintenance_invoices', schema=None) as batch_op:
+        batch_op.create_index('ix_maintenance_invoices_user_year_month', ['user_id', 'year', 'month'], unique=True)
+        batch_op.create_index('ix_maintenance_invoices_year_month_status', ['year', 'month', 'status'], unique=False)
+        batch_op.drop_index(batch_op.f('ix_maintenance_invoices_user_id'))
+
+
+def downgrade():
+    with op.batch_alter_table('maintenance_invoices', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_maintenance_invoices_user_id'), ['user_id'], unique=False)
+        batch_op.drop_index('ix_maintenance_invoices_year_month_status')
+        batch_op.drop_index('ix_maintenance_invoices_user_year_month')
@@ -0,0 +1,52 @@
+"""Building month stats
+
+Revision ID: 1b7e9d3f5a20
+Revises: 0a6e4d2f9c13
+Create Date: 2026-10-17 16:05:12.384190
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1b7e9d3f5a20'
+down_revision = '0a6e4d2f9c13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('building_month_stats',
+    sa.Column('building', sa.String(length=10), nullable=False),
+    sa.Column('year', sa.Integer(), nullable=False),
+    sa.Column('month', sa.Integer(), nullable=False),
+    sa.Column('unit_count', sa.Integer(), nullable=False),
+    sa.Column('paid_count', sa.Integer(), nullable=False),
+    sa.Column('paid_amount', sa.Numeric(precision=12, scale=2), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('building', 'year', 'month')
+    )
+
+    # Backfill from invoices (same as `flask month-stats rebuild`)
+    op.execute(
+        """
+        INSERT INTO building_month_stats (building, year, month, unit_count, paid_count, paid_amount, updated_at)
+        SELECT pd.building,
+               i.year,
+               i.month,
+               COUNT(i.id),
+               SUM(CASE WHEN i.status = 'PAID' THEN 1 ELSE 0 END),
+               COALESCE(SUM(CASE WHEN i.status = 'PAID' THEN i.amount ELSE 0 END), 0),
+               CURRENT_TIMESTAMP
+        FROM maintenance_invoices i
+        JOIN users u ON u.id = i.user_id
+        JOIN person_details pd ON pd.user_id = u.id
+        WHERE u.role = 'RESIDENT'
+        GROUP BY pd.building, i.year, i.month
+        """
+    )
+
+
+def downgrade():
+    op.drop_table('building_month_stats')
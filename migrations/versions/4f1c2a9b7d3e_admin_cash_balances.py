@@ -0,0 +1,58 @@
+"""Admin cash balances
+
+Revision ID: 4f1c2a9b7d3e
+Revises: 2ca948ba7992
+Create Date: 2026-10-17 10:12:41.502337
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4f1c2a9b7d3e'
+down_revision = '2ca948ba7992'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('admin_cash_balances',
+    sa.Column('admin_id', sa.Integer(), nullable=False),
+    sa.Column('collected_amount', sa.Numeric(precision=12, scale=2), nullable=False),
+    sa.Column('settled_amount', sa.Numeric(precision=12, scale=2), nullable=False),
+    sa.Column('payments_count', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['admin_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('admin_id')
+    )
+
+    # Backfill from history (same as `flask cash-balances reconcile`)
+    op.execute(
+        """
+        INSERT INTO admin_cash_balances (admin_id, collected_amount, settled_amount, payments_count, updated_at)
+        SELECT u.id,
+               COALESCE(p.collected_amount, 0),
+               COALESCE(s.settled_amount, 0),
+               COALESCE(p.payments_count, 0),
+               CURRENT_TIMESTAMP
+        FROM users u
+        LEFT JOIN (
+            SELECT collected_by_admin_id AS admin_id,
+                   SUM(amount) AS collected_amount,
+                   COUNT(id) AS payments_count
+            FROM payments
+            GROUP BY collected_by_admin_id
+        ) p ON p.admin_id = u.id
+        LEFT JOIN (
+            SELECT admin_id, SUM(amount) AS settled_amount
+            FROM settlements
+            GROUP BY admin_id
+        ) s ON s.admin_id = u.id
+        WHERE p.admin_id IS NOT NULL OR s.admin_id IS NOT NULL
+        """
+    )
+
+
+def downgrade():
+    op.drop_table('admin_cash_balances')
@@ -0,0 +1,51 @@
+"""Units registry
+
+Revision ID: 5c8d2e6a7f41
+Revises: 1b7e9d3f5a20
+Create Date: 2026-10-17 17:32:48.019275
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5c8d2e6a7f41'
+down_revision = '1b7e9d3f5a20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('units',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('building', sa.String(length=10), nullable=False),
+    sa.Column('floor', sa.String(length=10), nullable=False),
+    sa.Column('apartment', sa.String(length=10), nullable=False),
+    sa.Column('occupied', sa.Boolean(), nullable=False),
+    sa.Column('monthly_fee', sa.Numeric(precision=10, scale=2), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('building', 'floor', 'apartment', name='uq_units_building_floor_apartment')
+    )
+    with op.batch_alter_table('units', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_units_building'), ['building'], unique=False)
+
+    # Seed from current residents (same as `flask units sync`), default fee 200
+    op.execute(
+        """
+        INSERT INTO units (building, floor, apartment, occupied, monthly_fee, created_at, updated_at)
+        SELECT DISTINCT pd.building, pd.floor, pd.apartment, TRUE, 200, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP
+        FROM person_details pd
+        JOIN users u ON u.id = pd.user_id
+        WHERE u.role = 'RESIDENT' AND pd.building <> ''
+        """
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('units', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_units_building'))
+
+    op.drop_table('units')
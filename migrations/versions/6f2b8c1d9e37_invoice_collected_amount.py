@@ -0,0 +1,46 @@
+"""maintenance_invoices.collected_amount + partial index on short PAID invoices
+
+Revision ID: 6f2b8c1d9e37
+Revises: 8e3f1a9c4b62
+Create Date: 2026-10-17 21:12:40.518203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6f2b8c1d9e37'
+down_revision = '8e3f1a9c4b62'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('maintenance_invoices', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('collected_amount', sa.Numeric(precision=10, scale=2), server_default='0', nullable=False))
+
+    # Backfill from payments
+    op.execute(
+        """
+        UPDATE maintenance_invoices
+        SET collected_amount = COALESCE(
+            (SELECT SUM(payments.amount) FROM payments WHERE payments.invoice_id = maintenance_invoices.id), 0
+        )
+        """
+    )
+
+    with op.batch_alter_table('maintenance_invoices', schema=None) as batch_op:
+        batch_op.create_index(
+            'ix_maintenance_invoices_paid_short',
+            ['user_id'],
+            unique=False,
+            postgresql_where=sa.text("status = 'PAID' AND collected_amount < amount"),
+            sqlite_where=sa.text("status = 'PAID' AND collected_amount < amount"),
+        )
+
+
+def downgrade():
+    with op.batch_alter_table('maintenance_invoices', schema=None) as batch_op:
+        batch_op.drop_index('ix_maintenance_invoices_paid_short')
+        batch_op.drop_column('collected_amount')
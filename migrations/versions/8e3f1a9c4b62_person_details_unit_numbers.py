@@ -0,0 +1,54 @@
+"""person_details floor_num / apartment_num + (building, floor_num, apartment_num) index
+
+Revision ID: 8e3f1a9c4b62
+Revises: 5c8d2e6a7f41
+Create Date: 2026-10-17 18:47:03.662158
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8e3f1a9c4b62'
+down_revision = '5c8d2e6a7f41'
+branch_labels = None
+depends_on = None
+
+
+def _unit_number(value):
+    # same rule as app.models.unit_number (kept here so the migration doesn't import the app)
+    value = (value or "").strip()
+    if not value.isdigit() or not value.isascii():
+        return None
+    number = int(value)
+    return number if number < 2 ** 31 else None
+
+
+def upgrade():
+    with op.batch_alter_table('person_details', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('floor_num', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('apartment_num', sa.Integer(), nullable=True))
+
+    # Populate from the string columns; non-numeric values stay NULL
+    bind = op.get_bind()
+    rows = bind.execute(sa.text("SELECT id, floor, apartment FROM person_details")).fetchall()
+    values = [
+        {"id": r.id, "floor_num": _unit_number(r.floor), "apartment_num": _unit_number(r.apartment)}
+        for r in rows
+    ]
+    if values:
+        bind.execute(
+            sa.text("UPDATE person_details SET floor_num = :floor_num, apartment_num = :apartment_num WHERE id = :id"),
+            values,
+        )
+
+    with op.batch_alter_table('person_details', schema=None) as batch_op:
+        batch_op.create_index('ix_person_details_building_floor_num_apartment_num', ['building', 'floor_num', 'apartment_num'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('person_details', schema=None) as batch_op:
+        batch_op.drop_index('ix_person_details_building_floor_num_apartment_num')
+        batch_op.drop_column('apartment_num')
+        batch_op.drop_column('floor_num')
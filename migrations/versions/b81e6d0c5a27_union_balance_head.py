@@ -0,0 +1,42 @@
+"""Union balance head row
+
+Revision ID: b81e6d0c5a27
+Revises: 4f1c2a9b7d3e
+Create Date: 2026-10-17 11:03:18.774120
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b81e6d0c5a27'
+down_revision = '4f1c2a9b7d3e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('union_balance',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('balance', sa.Numeric(precision=12, scale=2), nullable=False),
+    sa.Column('last_entry_id', sa.Integer(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['last_entry_id'], ['union_ledger.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+    # Seed the head from the latest ledger entry
+    op.execute(
+        """
+        INSERT INTO union_balance (id, balance, last_entry_id, updated_at)
+        SELECT 1,
+               COALESCE((SELECT balance_after FROM union_ledger ORDER BY id DESC LIMIT 1), 0),
+               (SELECT id FROM union_ledger ORDER BY id DESC LIMIT 1),
+               CURRENT_TIMESTAMP
+        """
+    )
+
+
+def downgrade():
+    op.drop_table('union_balance')
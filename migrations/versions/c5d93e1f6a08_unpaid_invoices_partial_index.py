@@ -0,0 +1,32 @@
+"""Partial index on unpaid invoices
+
+Revision ID: c5d93e1f6a08
+Revises: b81e6d0c5a27
+Create Date: 2026-10-17 11:41:52.190364
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5d93e1f6a08'
+down_revision = 'b81e6d0c5a27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('maintenance_invoices', schema=None) as batch_op:
+        batch_op.create_index(
+            'ix_maintenance_invoices_status_unpaid',
+            ['status'],
+            unique=False,
+            postgresql_where=sa.text("status <> 'PAID'"),
+            sqlite_where=sa.text("status <> 'PAID'"),
+        )
+
+
+def downgrade():
+    with op.batch_alter_table('maintenance_invoices', schema=None) as batch_op:
+        batch_op.drop_index('ix_maintenance_invoices_status_unpaid')
@@ -0,0 +1,32 @@
+"""Notification subscription delivery tracking
+
+Revision ID: d2a7f4c81e95
+Revises: c5d93e1f6a08
+Create Date: 2026-10-17 12:20:07.631845
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2a7f4c81e95'
+down_revision = 'c5d93e1f6a08'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('notification_subscriptions', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('last_success_at', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('last_failure_at', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('failure_count', sa.Integer(), server_default='0', nullable=False))
+        batch_op.create_index(batch_op.f('ix_notification_subscriptions_user_id'), ['user_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('notification_subscriptions', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_notification_subscriptions_user_id'))
+        batch_op.drop_column('failure_count')
+        batch_op.drop_column('last_failure_at')
+        batch_op.drop_column('last_success_at')
@@ -0,0 +1,26 @@
+"""User token version
+
+Revision ID: e7b05a3c9d14
+Revises: d2a7f4c81e95
+Create Date: 2026-10-17 13:05:42.118203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7b05a3c9d14'
+down_revision = 'd2a7f4c81e95'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('token_version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_column('token_version')
@@ -0,0 +1,26 @@
+"""person_details unit index
+
+Revision ID: f3a81c6e2b70
+Revises: e7b05a3c9d14
+Create Date: 2026-10-17 13:48:19.502716
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3a81c6e2b70'
+down_revision = 'e7b05a3c9d14'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('person_details', schema=None) as batch_op:
+        batch_op.create_index('ix_person_details_building_floor_apartment', ['building', 'floor', 'apartment'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('person_details', schema=None) as batch_op:
+        batch_op.drop_index('ix_person_details_building_floor_apartment')